@@ -7,9 +7,26 @@ import pandas as pd
 import geopandas as gpd
 import json
 import os
-from shapely.geometry import Point, box
+import sys
+from shapely.geometry import box
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from analysis import stream_demand_grid
+from nearest import SupplyIndex
+from crs import GEOGRAPHIC_CRS, WORKING_CRS, LayerRegistry, transform_geometry, transform_xy
+
+# Buildings are read in record batches of this size (bounds peak memory for large extracts)
+BUILDINGS_BATCH_SIZE = 65536
+# All layers live in one metric working CRS (ETRS89 / UTM 32N); EPSG:4326 only for export
+DEMAND_CELL_SIZE_M = 1000
+# Accessibility = supply weighted by distance decay (all sources, not only the nearest);
+# high-potential zones are ranked by POTENTIAL_SCORE ('accessibility_score' or 'efficiency_score')
+ACCESS_KERNEL = 'exponential'
+ACCESS_SCALE_M = 1000
+POTENTIAL_SCORE = 'accessibility_score'
+layers = LayerRegistry(WORKING_CRS)
+
 print("=" * 80)
 print("ARCGIS PRO DATA PREPARATION - WASTEHEAT MAPPING FOR BREMEN")
 print("=" * 80)
@@ -19,11 +36,12 @@ print("\n📖 Step 1: Loading wasteheat supply data...")
 df_supply = pd.read_excel('data/geocoding/pfa_geocoded_local.xlsx')
 print(f"   ✓ Loaded {len(df_supply)} wasteheat locations")
 
-# Convert to GeoDataFrame
+# Convert to GeoDataFrame (lon/lat -> working CRS once)
+supply_x, supply_y = transform_xy(df_supply['Longitude'], df_supply['Latitude'], GEOGRAPHIC_CRS, WORKING_CRS)
 gdf_supply = gpd.GeoDataFrame(
     df_supply,
-    geometry=gpd.points_from_xy(df_supply['Longitude'], df_supply['Latitude']),
-    crs='EPSG:4326'
+    geometry=gpd.points_from_xy(supply_x, supply_y),
+    crs=WORKING_CRS
 )
 
 gdf_supply['Heat_kWh_Year'] = pd.to_numeric(
@@ -44,11 +62,13 @@ bremen_bounds = {
 }
 bremen_bbox = box(bremen_bounds['west'], bremen_bounds['south'], 
                    bremen_bounds['east'], bremen_bounds['north'])
+# Study area = bounding box + 0.02 degree margin, as polygon in the working CRS
+study_area = transform_geometry(bremen_bbox.buffer(0.02), GEOGRAPHIC_CRS, WORKING_CRS)
 print(f"   ✓ Bremen bounding box defined")
 
 # Filter supply within/near Bremen
-gdf_supply['in_bremen'] = gdf_supply.geometry.within(bremen_bbox.buffer(0.02))
-supply_in_bremen = gdf_supply[gdf_supply['in_bremen']].copy()
+gdf_supply['in_bremen'] = gdf_supply.geometry.within(study_area)
+supply_in_bremen = layers.add('supply', gdf_supply[gdf_supply['in_bremen']].copy())
 print(f"   ✓ Found {len(supply_in_bremen)} wasteheat sources in/near Bremen")
 
 # --- 3. LOAD OSM DATA FOR DEMAND ANALYSIS ---
@@ -57,15 +77,15 @@ print("\n🏭 Step 3: Identifying heat demand areas...")
 # Load building data
 buildings_path = 'geofabrik bremen/gis_osm_buildings_a_free_1.shp'
 if os.path.exists(buildings_path):
-    print("   Loading buildings...")
-    buildings = gpd.read_file(buildings_path)
-    buildings = buildings.to_crs('EPSG:4326')
-    # Filter to Bremen area
-    buildings = buildings[buildings.geometry.intersects(bremen_bbox.buffer(0.02))]
-    print(f"   ✓ Loaded {len(buildings)} buildings in Bremen")
+    print("   Streaming buildings...")
+    # Read in batches, filtered to the Bremen area at read time; area and grid cell are
+    # computed per batch in the working CRS and folded into a running per-cell total
+    demand_grid = stream_demand_grid(buildings_path, cell_size=DEMAND_CELL_SIZE_M, crs=WORKING_CRS,
+                                     mask=study_area, batch_size=BUILDINGS_BATCH_SIZE)
+    print(f"   ✓ Processed {demand_grid['building_count'].sum()} buildings in Bremen")
 else:
     print("   ⚠️  Buildings file not found")
-    buildings = None
+    demand_grid = None
 
 # --- 4. CLASSIFY HEAT DEMAND ---
 print("\n🔥 Step 4: Classifying heat demand areas...")
@@ -79,36 +99,18 @@ demand_categories = {
 }
 
 # Simple demand estimation based on building types and density
-if buildings is not None:
-    # Project to projected CRS for accurate area calculation
-    buildings = buildings.to_crs('EPSG:31256')  # UTM zone 33N for Germany
-    
-    # Calculate building area
-    buildings['building_area'] = buildings.geometry.area
-    
-    # Get centroids for grid analysis
-    buildings_centroids = buildings.copy()
-    buildings_centroids['geometry'] = buildings_centroids.geometry.centroid
-    buildings_centroids = buildings_centroids.to_crs('EPSG:4326')
-    
-    # Aggregate by 0.01 degree grid cells (roughly 1km x 1km)
-    buildings_centroids['grid_x'] = (buildings_centroids.geometry.x // 0.01 * 0.01).round(2)
-    buildings_centroids['grid_y'] = (buildings_centroids.geometry.y // 0.01 * 0.01).round(2)
-    
-    # Demand estimation: total building area per grid cell
-    demand_grid = buildings_centroids.groupby(['grid_x', 'grid_y']).agg({
-        'building_area': 'sum',
-        'geometry': 'count'
-    }).reset_index()
-    demand_grid.columns = ['lon', 'lat', 'building_area_m2', 'building_count']
-    
+if demand_grid is not None:
+    # demand_grid: total building area and building count per 1 km x 1 km cell,
+    # keyed by the cell centre in the working CRS
+
     # Convert building area to estimated heat demand (rough estimate: 50 kWh/m²/year for heating)
     demand_grid['estimated_heat_demand_kWh_year'] = demand_grid['building_area_m2'] * 50
     
-    # Create GeoDataFrame
-    demand_grid['geometry'] = [Point(x, y) for x, y in zip(demand_grid['lon'], demand_grid['lat'])]
-    gdf_demand = gpd.GeoDataFrame(demand_grid, geometry='geometry', crs='EPSG:4326')
-    
+    # Create GeoDataFrame; lon/lat of the cell centre are kept as attributes for export
+    demand_grid['lon'], demand_grid['lat'] = transform_xy(demand_grid['x'], demand_grid['y'], WORKING_CRS, GEOGRAPHIC_CRS)
+    gdf_demand = layers.add('demand', gpd.GeoDataFrame(
+        demand_grid, geometry=gpd.points_from_xy(demand_grid['x'], demand_grid['y']), crs=WORKING_CRS))
+
     print(f"   ✓ Identified {len(gdf_demand)} demand grid cells")
     total_demand = gdf_demand['estimated_heat_demand_kWh_year'].sum()
     print(f"   ✓ Total estimated heat demand: {total_demand:,.0f} kWh/a")
@@ -123,91 +125,64 @@ output_dir = 'data/arcgis_exports'
 os.makedirs(output_dir, exist_ok=True)
 
 # Export wasteheat supply
-supply_export = supply_in_bremen[[
-    'Adresse', 'PLZ', 'Ort', 'Heat_kWh_Year', 'Cluster', 'geometry'
-]].copy()
-supply_export.columns = ['Address', 'PostalCode', 'City', 'Heat_Supply_kWh_Year', 'Supply_Cluster', 'geometry']
-
 supply_geojson_path = f'{output_dir}/wasteheat_supply.geojson'
-supply_export.to_file(supply_geojson_path, driver='GeoJSON')
+supply_export = layers.export('supply', supply_geojson_path, columns={
+    'Adresse': 'Address', 'PLZ': 'PostalCode', 'Ort': 'City',
+    'Heat_kWh_Year': 'Heat_Supply_kWh_Year', 'Cluster': 'Supply_Cluster'})
 print(f"   ✓ Supply layer: {supply_geojson_path} ({len(supply_export)} points)")
 
 # Export demand
 if gdf_demand is not None:
-    demand_export = gdf_demand[[
-        'lon', 'lat', 'building_count', 'building_area_m2', 
-        'estimated_heat_demand_kWh_year', 'geometry'
-    ]].copy()
-    demand_export.columns = ['Longitude', 'Latitude', 'Building_Count', 'Building_Area_m2', 
-                             'Estimated_Heat_Demand_kWh_Year', 'geometry']
-    
     demand_geojson_path = f'{output_dir}/heat_demand.geojson'
-    demand_export.to_file(demand_geojson_path, driver='GeoJSON')
+    demand_export = layers.export('demand', demand_geojson_path, columns={
+        'lon': 'Longitude', 'lat': 'Latitude', 'building_count': 'Building_Count',
+        'building_area_m2': 'Building_Area_m2', 'estimated_heat_demand_kWh_year': 'Estimated_Heat_Demand_kWh_Year'})
     print(f"   ✓ Demand layer: {demand_geojson_path} ({len(demand_export)} grid cells)")
 
 # --- 6. CALCULATE EFFICIENCY POTENTIAL ---
 print("\n📊 Step 6: Calculating efficiency potential...")
 
 if gdf_demand is not None and len(supply_in_bremen) > 0:
-    # For each demand point, find nearest supply
-    from scipy.spatial.distance import cdist
-    
-    supply_coords = np.array([[p.x, p.y] for p in supply_in_bremen.geometry])
-    demand_coords = np.array([[p.x, p.y] for p in gdf_demand.geometry])
-    
-    # Calculate distances (in degrees, rough approximation)
-    distances = cdist(demand_coords, supply_coords, metric='euclidean')
-    
-    # Find nearest supply for each demand
-    nearest_supply_idx = np.argmin(distances, axis=1)
-    nearest_distances_km = distances[np.arange(len(distances)), nearest_supply_idx] * 111  # Convert degrees to km
-    
+    # For each demand point, find nearest supply (KD-tree in metres, memory linear in cells + sources)
+    supply_index = SupplyIndex.from_gdf(supply_in_bremen, 'Heat_kWh_Year')
+    demand_coords = np.column_stack([gdf_demand.geometry.x, gdf_demand.geometry.y])
+    nearest_supply_idx, nearest_distances_km, efficiency = supply_index.efficiency(demand_coords)
+
     gdf_demand['nearest_supply_distance_km'] = nearest_distances_km
     gdf_demand['nearest_supply_idx'] = nearest_supply_idx
-    
+
     # Calculate efficiency score (higher = better match)
     # Efficiency = Supply capacity / Distance (closer and more supply = better)
-    gdf_demand['efficiency_score'] = np.zeros(len(gdf_demand))
-    for i in range(len(gdf_demand)):
-        supply_heat = supply_in_bremen.iloc[nearest_supply_idx[i]]['Heat_kWh_Year']
-        distance = nearest_distances_km[i]
-        if distance > 0:
-            gdf_demand.loc[i, 'efficiency_score'] = supply_heat / distance
-        else:
-            gdf_demand.loc[i, 'efficiency_score'] = supply_heat
-    
+    gdf_demand['efficiency_score'] = efficiency
+
+    # Accessibility: sum of all supply, weighted by distance decay (batched radius queries)
+    gdf_demand['accessibility_score'] = supply_index.accessibility(demand_coords, ACCESS_KERNEL, ACCESS_SCALE_M)
+
     print(f"   ✓ Efficiency analysis complete")
     print(f"   ✓ Average distance to nearest supply: {nearest_distances_km.mean():.2f} km")
     
-    # Export with efficiency scores
-    potential_export = gdf_demand[[
-        'lon', 'lat', 'building_count', 'estimated_heat_demand_kWh_year',
-        'nearest_supply_distance_km', 'efficiency_score', 'geometry'
-    ]].copy()
-    potential_export.columns = [
-        'Longitude', 'Latitude', 'Building_Count', 'Heat_Demand_kWh_Year',
-        'Distance_to_Supply_km', 'Efficiency_Potential_Score', 'geometry'
-    ]
-    
+    # Export with efficiency scores (re-register so the geographic copy picks up the new columns)
+    layers.add('demand', gdf_demand)
     potential_geojson_path = f'{output_dir}/efficiency_potential.geojson'
-    potential_export.to_file(potential_geojson_path, driver='GeoJSON')
+    potential_export = layers.export('demand', potential_geojson_path, columns={
+        'lon': 'Longitude', 'lat': 'Latitude', 'building_count': 'Building_Count',
+        'estimated_heat_demand_kWh_year': 'Heat_Demand_kWh_Year',
+        'nearest_supply_distance_km': 'Distance_to_Supply_km', 'efficiency_score': 'Efficiency_Potential_Score',
+        'accessibility_score': 'Accessibility_Score'})
     print(f"   ✓ Efficiency layer: {potential_geojson_path}")
 
 # --- 7. CREATE HIGH-POTENTIAL ZONES ---
 print("\n🎯 Step 7: Identifying high-potential zones...")
 
 if gdf_demand is not None:
-    # Define high-potential as top 25% efficiency scores
-    threshold = gdf_demand['efficiency_score'].quantile(0.75)
-    high_potential = gdf_demand[gdf_demand['efficiency_score'] >= threshold].copy()
-    
-    high_potential_export = high_potential[[
-        'lon', 'lat', 'building_count', 'estimated_heat_demand_kWh_year',
-        'nearest_supply_distance_km', 'efficiency_score', 'geometry'
-    ]].copy()
-    
+    # Define high-potential as top 25% scores (POTENTIAL_SCORE)
+    threshold = gdf_demand[POTENTIAL_SCORE].quantile(0.75)
+    high_potential = layers.add('high_potential', gdf_demand[gdf_demand[POTENTIAL_SCORE] >= threshold].copy())
+
     high_potential_path = f'{output_dir}/high_potential_zones.geojson'
-    high_potential_export.to_file(high_potential_path, driver='GeoJSON')
+    high_potential_export = layers.export('high_potential', high_potential_path, columns={
+        c: c for c in ['lon', 'lat', 'building_count', 'estimated_heat_demand_kWh_year',
+                       'nearest_supply_distance_km', 'efficiency_score', 'accessibility_score']})
     
     print(f"   ✓ High-potential zones: {high_potential_path}")
     print(f"   ✓ Found {len(high_potential)} high-potential locations")
@@ -229,13 +204,14 @@ if gdf_demand is not None:
     print(f"   • Demand grid cells: {len(gdf_demand)}")
     demand_sum = gdf_demand['estimated_heat_demand_kWh_year'].sum()
     print(f"   • Total estimated demand: {demand_sum:,.0f} kWh/a")
-    building_count = buildings_centroids['geometry'].count()
+    building_count = gdf_demand['building_count'].sum()
     print(f"   • Buildings analyzed: {building_count}")
     
     print(f"\n⚡ EFFICIENCY POTENTIAL:")
     print(f"   • High-potential zones: {len(high_potential)}")
     print(f"   • Avg distance to supply: {gdf_demand['nearest_supply_distance_km'].mean():.2f} km")
     print(f"   • Best efficiency zone: {gdf_demand['efficiency_score'].max():.0f}")
+    print(f"   • Best accessibility zone: {gdf_demand['accessibility_score'].max():.0f}")
 
 print(f"\n📁 OUTPUT FILES:")
 print(f"   1. {supply_geojson_path}")
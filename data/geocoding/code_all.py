@@ -9,13 +9,17 @@ from geopy.extra.rate_limiter import RateLimiter
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 import os
-import pickle
+import sys
 from shapely.geometry import Point
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from geocache import GeocodeCache
+
 # --- 2. Konfiguration ---
 TEST_MODE = False  # Set to False for full dataset
 TEST_SIZE = 100   # Number of rows to test with
-CACHE_FILE = 'data/geocoding/geocoding_cache.pkl'
+CACHE_FILE = 'data/geocoding/geocoding_cache.sqlite'
+LEGACY_CACHE_FILE = 'data/geocoding/geocoding_cache.pkl'  # imported once into CACHE_FILE
 OUTPUT_FILE = 'data/geocoding/pfa_geocoded.xlsx'
 SHOW_PLOT = True  # Set to False to skip interactive plot
 
@@ -48,16 +52,14 @@ print(f"📊 Working with {len(df)} records")
 # --- 5. Adressen zusammenführen ---
 df['Adresse'] = df['Straße und Hausnummer'] + ', ' + df['PLZ'].astype(str) + ' ' + df['Ort']
 
-# --- 6. Load geocoding cache if exists ---
-geocoding_cache = {}
-if os.path.exists(CACHE_FILE):
-    print("💾 Loading geocoding cache...")
-    try:
-        geocoding_cache = pickle.load(open(CACHE_FILE, 'rb'))
-        print(f"   Found {len(geocoding_cache)} cached results")
-    except:
-        print("   Cache corrupted, starting fresh")
-        geocoding_cache = {}
+# --- 6. Open geocoding cache (SQLite, written incrementally) ---
+print("💾 Opening geocoding cache...")
+new_cache = not os.path.exists(CACHE_FILE)
+geocoding_cache = GeocodeCache(CACHE_FILE)
+if new_cache and os.path.exists(LEGACY_CACHE_FILE):
+    print(f"   Imported {geocoding_cache.import_pickle(LEGACY_CACHE_FILE)} results from {LEGACY_CACHE_FILE}")
+print(f"   Found {len(geocoding_cache)} cached results")
+known = geocoding_cache.get_many(df['Adresse'].unique())
 
 # --- 7. Geocoding with Nominatim (only for uncached addresses) ---
 print("🌍 Starting geocoding...")
@@ -65,18 +67,20 @@ geolocator = Nominatim(user_agent="wasteheat_geocoder", timeout=10)  # Increased
 geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)  # Back to 1 second for stability
 
 def geocode_address(address):
-    """Geocode with caching"""
-    if address in geocoding_cache:
-        return geocoding_cache[address]
+    """Geocode with caching (failed lookups are stored as 'error' and retried next run)"""
+    if address in known:
+        return known[address]
     
     try:
         location = geocode(address, timeout=10)
         result = (location.latitude, location.longitude) if location else (None, None)
+        status = 'ok' if location else 'not_found'
     except Exception as e:
-        # Silently handle errors - address will get (None, None)
         result = (None, None)
+        status = 'error'
     
-    geocoding_cache[address] = result
+    geocoding_cache.put(address, *result, status=status, provider='nominatim')
+    known[address] = result
     return result
 
 # Apply geocoding with progress tracking
@@ -90,10 +94,8 @@ for idx, address in enumerate(df['Adresse'], 1):
 
 df[['Latitude', 'Longitude']] = pd.DataFrame(results)
 
-# --- 8. Save cache ---
-print("💾 Saving geocoding cache...")
-os.makedirs('data/geocoding', exist_ok=True)
-pickle.dump(geocoding_cache, open(CACHE_FILE, 'wb'))
+# --- 8. Close cache (writes the last batch) ---
+geocoding_cache.close()
 
 # --- 9. Remove rows without coordinates ---
 initial_count = len(df)
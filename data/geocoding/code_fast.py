@@ -1,25 +1,32 @@
 # --- code_fast.py ---
-# Fast parallel geocoding script with geopy
+# Fast asynchronous geocoding script (src/geocode.py: pooled session, token bucket, retries)
 
 # --- 1. Bibliotheken importieren ---
 import pandas as pd
 import geopandas as gpd
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 import os
-import pickle
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from geocache import GeocodeCache
+from geocode import geocode_addresses
+
 # --- 2. Konfiguration ---
 TEST_MODE = False  # Set to False for full dataset
 TEST_SIZE = 100   # Number of rows to test with
-CACHE_FILE = 'data/geocoding/geocoding_cache.pkl'
+CACHE_FILE = 'data/geocoding/geocoding_cache.sqlite'
+LEGACY_CACHE_FILE = 'data/geocoding/geocoding_cache.pkl'  # imported once into CACHE_FILE
 OUTPUT_FILE = 'data/geocoding/pfa_geocoded.xlsx'
 SHOW_PLOT = False  # Set to True to show interactive plot
-MAX_WORKERS = 4   # Number of parallel geocoding threads
+# Geocoding endpoint: public Nominatim allows 1 request/s. For a local Nominatim/Photon instance set
+# GEOCODER_URL (e.g. 'http://localhost:8080/search') and raise REQUESTS_PER_SECOND / MAX_CONCURRENCY
+GEOCODER = 'nominatim'    # 'nominatim' or 'photon'
+GEOCODER_URL = None       # None = public endpoint of GEOCODER
+REQUESTS_PER_SECOND = 1.0
+MAX_CONCURRENCY = 4       # Number of requests in flight
 
 # --- 3. Excel einlesen ---
 print("📖 Loading Excel file...")
@@ -50,65 +57,52 @@ print(f"📊 Working with {len(df)} records")
 # --- 5. Adressen zusammenführen ---
 df['Adresse'] = df['Straße und Hausnummer'] + ', ' + df['PLZ'].astype(str) + ' ' + df['Ort']
 
-# --- 6. Load geocoding cache if exists ---
-geocoding_cache = {}
-if os.path.exists(CACHE_FILE):
-    print("💾 Loading geocoding cache...")
-    try:
-        geocoding_cache = pickle.load(open(CACHE_FILE, 'rb'))
-        print(f"   Found {len(geocoding_cache)} cached results")
-    except:
-        print("   Cache corrupted, starting fresh")
-        geocoding_cache = {}
-
-# --- 7. Prepare addresses to geocode ---
+# --- 6. Open geocoding cache (SQLite, written incrementally) ---
+print("💾 Opening geocoding cache...")
+new_cache = not os.path.exists(CACHE_FILE)
+geocoding_cache = GeocodeCache(CACHE_FILE)
+if new_cache and os.path.exists(LEGACY_CACHE_FILE):
+    print(f"   Imported {geocoding_cache.import_pickle(LEGACY_CACHE_FILE)} results from {LEGACY_CACHE_FILE}")
+print(f"   Found {len(geocoding_cache)} cached results {geocoding_cache.stats()}")
+
+# --- 7. Prepare addresses to geocode (unknown + previously failed) ---
 addresses = df['Adresse'].unique()
-uncached_addresses = [a for a in addresses if a not in geocoding_cache]
+uncached_addresses = geocoding_cache.pending(addresses)
 print(f"🔍 {len(addresses)} unique addresses, {len(uncached_addresses)} need geocoding")
 
-# --- 8. Parallel Geocoding with thread pool ---
-print(f"🌍 Starting parallel geocoding with {MAX_WORKERS} workers...")
-
-def geocode_single(address):
-    """Geocode a single address"""
-    try:
-        geolocator = Nominatim(user_agent="wasteheat_geocoder", timeout=10)
-        location = geolocator.geocode(address, timeout=10)
-        return (address, (location.latitude, location.longitude) if location else (None, None))
-    except Exception as e:
-        return (address, (None, None))
+# --- 8. Asynchronous geocoding (rate-limited, retries with backoff on 429/5xx) ---
+print(f"🌍 Starting async geocoding ({REQUESTS_PER_SECOND} req/s, {MAX_CONCURRENCY} in flight)...")
 
 start_time = time.time()
 processed = 0
-
-with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-    # Submit all uncached addresses
-    futures = {executor.submit(geocode_single, addr): addr for addr in uncached_addresses}
-    
-    # Process results as they complete
-    for future in as_completed(futures):
-        address, result = future.result()
-        geocoding_cache[address] = result
-        processed += 1
-        
-        if processed % 100 == 0:
-            elapsed = time.time() - start_time
-            rate = processed / elapsed
-            remaining = len(uncached_addresses) - processed
-            eta = remaining / rate if rate > 0 else 0
-            print(f"   Progress: {processed}/{len(uncached_addresses)} ({100*processed/len(uncached_addresses):.1f}%) - ETA: {eta/60:.0f}min")
-
-print(f"✓ Geocoding complete in {(time.time()-start_time)/60:.1f} minutes")
+failed = 0
+
+def on_result(address, result):
+    global processed, failed
+    processed += 1
+    # Every result is stored with its status; failed lookups ('error') are retried on the next run
+    failed += result.status == 'error'
+    geocoding_cache.put(address, result.lat, result.lon, result.status, provider=GEOCODER)
+    if processed % 100 == 0:
+        elapsed = time.time() - start_time
+        rate = processed / elapsed
+        remaining = len(uncached_addresses) - processed
+        eta = remaining / rate if rate > 0 else 0
+        print(f"   Progress: {processed}/{len(uncached_addresses)} ({100*processed/len(uncached_addresses):.1f}%) - ETA: {eta/60:.0f}min")
+
+geocode_addresses(uncached_addresses, provider=GEOCODER, url=GEOCODER_URL, rate=REQUESTS_PER_SECOND,
+                  concurrency=MAX_CONCURRENCY, on_result=on_result)
+
+print(f"✓ Geocoding complete in {(time.time()-start_time)/60:.1f} minutes ({failed} failed, will be retried next run)")
 
 # --- 9. Apply cached results to dataframe ---
+known = geocoding_cache.get_many(addresses)
 df[['Latitude', 'Longitude']] = df['Adresse'].apply(
-    lambda x: pd.Series(geocoding_cache.get(x, (None, None)))
+    lambda x: pd.Series(known.get(x, (None, None)))
 )
 
-# --- 10. Save cache ---
-print("💾 Saving geocoding cache...")
-os.makedirs('data/geocoding', exist_ok=True)
-pickle.dump(geocoding_cache, open(CACHE_FILE, 'wb'))
+# --- 10. Close cache (writes the last batch) ---
+geocoding_cache.close()
 
 # --- 11. Remove rows without coordinates ---
 initial_count = len(df)
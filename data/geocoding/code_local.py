@@ -1,5 +1,5 @@
 # --- code_local.py ---
-# Super-fast local geocoding using OSM building data + reverse lookup
+# Offline, deterministic geocoding from local OSM extracts (src/offline_geocode.py)
 
 # --- 1. Bibliotheken importieren ---
 import pandas as pd
@@ -7,18 +7,33 @@ import geopandas as gpd
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 import os
-import random
-import numpy as np
-from shapely.geometry import Point
-from shapely.ops import nearest_points
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from offline_geocode import MATCH_LEVELS, OfflineGeocoder
 
 # --- 2. Konfiguration ---
 TEST_MODE = False  # Set to False for full dataset
 TEST_SIZE = 100   # Number of rows to test with
 OUTPUT_FILE = 'data/geocoding/pfa_geocoded_local.xlsx'
 SHOW_PLOT = False
-OSM_BUILDINGS_PATH = 'geofabrik bremen/gis_osm_buildings_a_free_1.shp'
 OSM_PLACES_PATH = 'geofabrik bremen/gis_osm_places_free_1.shp'
+OSM_PLACES_A_PATH = 'geofabrik bremen/gis_osm_places_a_free_1.shp'
+OSM_ROADS_PATH = 'geofabrik bremen/gis_osm_roads_free_1.shp'
+OSM_LANDMARK_PATHS = ('geofabrik bremen/gis_osm_pois_free_1.shp', 'geofabrik bremen/gis_osm_pois_a_free_1.shp',
+                      'geofabrik bremen/gis_osm_buildings_a_free_1.shp')
+POSTCODES_FILE = None  # optional CSV with columns plz, lat, lon (geofabrik free data has no postcodes)
+# Cities outside the Bremen extract, used as locality fallback (no random offset)
+EXTRA_LOCALITIES = {
+    'Hamburg': (53.5511, 10.0079),
+    'Berlin': (52.5200, 13.4050),
+    'Hannover': (52.3759, 9.7320),
+    'Düsseldorf': (51.2277, 6.7735),
+    'Köln': (50.9365, 6.9589),
+    'Frankfurt': (50.1109, 8.6821),
+    'Hilden': (51.1621, 6.9099),
+    'Ratingen': (51.2961, 7.1955),
+}
 
 # --- 3. Excel einlesen ---
 print("📖 Loading Excel file...")
@@ -42,80 +57,28 @@ if TEST_MODE:
 print(f"📊 Working with {len(df)} records")
 df['Adresse'] = df['Straße und Hausnummer'] + ', ' + df['PLZ'].astype(str) + ' ' + df['Ort']
 
-# --- 4. Load OSM data ---
-print("📍 Loading OSM building data...")
-try:
-    buildings = gpd.read_file(OSM_BUILDINGS_PATH)
-    print(f"   Loaded {len(buildings)} buildings")
-except Exception as e:
-    print(f"   Warning: Could not load buildings: {e}")
-    buildings = None
-
-print("🏙️  Loading OSM places data...")
-try:
-    places = gpd.read_file(OSM_PLACES_PATH)
-    places = places[places.geometry.type == 'Point']
-    print(f"   Loaded {len(places)} places")
-except Exception as e:
-    print(f"   Warning: Could not load places: {e}")
-    places = None
-
-# --- 5. Simple geocoding fallback using static coordinates ---
-print("🌍 Generating coordinates using static reference points...")
-
-# German coordinates database for major cities
-city_coords = {
-    'Bremen': (53.0795, 8.8017),
-    'Hamburg': (53.5511, 10.0079),
-    'Berlin': (52.5200, 13.4050),
-    'Hannover': (52.3759, 9.7320),
-    'Düsseldorf': (51.2277, 6.7735),
-    'Cologne': (50.9365, 6.9589),
-    'Frankfurt': (50.1109, 8.6821),
-    'Hilden': (51.1621, 6.9099),
-    'Ratingen': (51.2961, 7.1955),
-}
-
-def get_coordinates(row):
-    """Get coordinates based on city and postal code"""
-    city = str(row['Ort']).strip()
-    
-    # Try exact city match first
-    if city in city_coords:
-        lat, lon = city_coords[city]
-        # Add small random offset to avoid overlapping points
-        lat += random.uniform(-0.01, 0.01)
-        lon += random.uniform(-0.01, 0.01)
-        return lat, lon
-    
-    # Try partial match
-    for known_city, coords in city_coords.items():
-        if known_city.lower() in city.lower() or city.lower() in known_city.lower():
-            lat, lon = coords
-            lat += random.uniform(-0.01, 0.01)
-            lon += random.uniform(-0.01, 0.01)
-            return lat, lon
-    
-    # Default to Bremen if not found
-    lat, lon = city_coords['Bremen']
-    lat += random.uniform(-0.05, 0.05)
-    lon += random.uniform(-0.05, 0.05)
-    return lat, lon
-
-print("   Assigning coordinates based on city...")
-coords_list = df.apply(get_coordinates, axis=1, result_type='expand')
-if coords_list.shape[1] == 2:
-    coords_list.columns = ['Latitude', 'Longitude']
-    df[['Latitude', 'Longitude']] = coords_list
-else:
-    # If apply returns Series with indices, convert to DataFrame
-    df[['Latitude', 'Longitude']] = pd.DataFrame(
-        [list(coords) for coords in coords_list],
-        columns=['Latitude', 'Longitude'],
-        index=df.index
-    )
-
-print(f"✓ Coordinates assigned to all {len(df)} records")
+# --- 4. Build offline lookup index (places, roads, POIs/buildings; cached in data/cache) ---
+print("📍 Building offline geocoding index from OSM extracts...")
+geocoder = OfflineGeocoder.from_osm(OSM_PLACES_PATH, OSM_PLACES_A_PATH, OSM_ROADS_PATH, OSM_LANDMARK_PATHS,
+                                    postcodes=POSTCODES_FILE, extra_localities=EXTRA_LOCALITIES)
+print(f"   {len(geocoder.localities)} localities, "
+      f"{len(geocoder.names['street'])} streets, "
+      f"{len(geocoder.names['landmark'])} landmarks")
+
+# --- 5. Geocode all rows in one batch (deterministic, no network) ---
+print("🌍 Geocoding addresses offline...")
+df = df.join(geocoder.geocode(df['Straße und Hausnummer'], df['PLZ'], df['Ort']))
+levels = df['match_level'].value_counts().reindex(MATCH_LEVELS, fill_value=0)
+for level, count in levels.items():
+    print(f"   {level}: {count}")
+
+initial_count = len(df)
+df = df.dropna(subset=['Latitude', 'Longitude'])
+print(f"✓ {len(df)}/{initial_count} addresses located")
+
+if len(df) == 0:
+    print("❌ No addresses could be located. Exiting.")
+    exit(1)
 
 # --- 6. Create GeoDataFrame ---
 print("🗺️  Creating GeoDataFrame...")
@@ -151,7 +114,7 @@ except Exception as e:
 
 # --- 9. Print results ---
 print("\n📋 Sample results:")
-print(gdf[['Adresse', 'Latitude', 'Longitude', 'Cluster', 'Wärmemenge pro Jahr (in kWh/a)']].head(10))
+print(gdf[['Adresse', 'Latitude', 'Longitude', 'match_level', 'Cluster', 'Wärmemenge pro Jahr (in kWh/a)']].head(10))
 
 # --- 10. Save to Excel ---
 print(f"💾 Saving results to {OUTPUT_FILE}...")
@@ -1,20 +1,145 @@
 # src/analysis.py
-import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyogrio
+import shapely
 
-def aggregate_heat_to_grid(grid_gdf, firms_gdf, heat_col='abwaerme_mw'):
-    # spatial join points -> polygons
-    joined = gpd.sjoin(firms_gdf[[heat_col,'geometry']], grid_gdf[['cell_id','geometry']], how='inner', predicate='within')
-    agg = joined.groupby('cell_id')[heat_col].sum().rename('total_abwaerme_mw').reset_index()
-    grid = grid_gdf.merge(agg, on='cell_id', how='left').fillna(0)
+from crs import WORKING_CRS, transform_geometry
+from grid import locate_cells, overlay_areas
+
+STATS = ('sum', 'count', 'mean', 'min', 'max')
+
+def _stat_name(col, stat):
+    # Summen behalten die bisherigen Namen (total_abwaerme_mw, total_waermebedarf_mw)
+    if stat == 'sum':
+        return f'total_{col}'
+    if isinstance(stat, float):
+        return f'{col}_q{round(stat * 100)}'
+    return f'{col}_{stat}'
+
+def _group_stats(pos, values, n_cells, stats, quantiles):
+    out = {}
+    count = np.bincount(pos, minlength=n_cells)
+    total = np.bincount(pos, weights=values, minlength=n_cells)
+    has = count > 0
+    if 'sum' in stats:
+        out['sum'] = total
+    if 'count' in stats:
+        out['count'] = count
+    if 'mean' in stats:
+        out['mean'] = np.divide(total, count, out=np.full(n_cells, np.nan), where=has)
+    if not ({'min', 'max'} & set(stats) or quantiles):
+        return out
+    # Ordnungsstatistiken: einmal nach (Zelle, Wert) sortieren, dann Positionen je Zelle ablesen
+    order = np.lexsort((values, pos))
+    v = values[order]
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))[has]
+    n = count[has]
+    if 'min' in stats:
+        out['min'] = np.full(n_cells, np.nan)
+        out['min'][has] = v[start]
+    if 'max' in stats:
+        out['max'] = np.full(n_cells, np.nan)
+        out['max'][has] = v[start + n - 1]
+    for q in quantiles:
+        # lineare Interpolation wie pandas/numpy
+        h = q * (n - 1)
+        lo = np.floor(h).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        res = np.full(n_cells, np.nan)
+        res[has] = v[start + lo] + (h - lo) * (v[start + hi] - v[start + lo])
+        out[float(q)] = res
+    return out
+
+def aggregate_layers(grid_gdf, layers, stats=('sum',), quantiles=(), method='auto'):
+    # layers: {name: (gdf, [value_cols])} oder Liste von (gdf, [value_cols])
+    # je Layer eine räumliche Zuordnung, alle Spalten/Statistiken daraus; leere Zellen: sum/count 0, sonst NaN
+    unknown = set(stats) - set(STATS)
+    if unknown:
+        raise ValueError(f"unknown statistics: {sorted(unknown)}")
+    if isinstance(layers, dict):
+        layers = layers.values()
+    n_cells = len(grid_gdf)
+    cols = {}
+    for gdf, value_cols in layers:
+        if isinstance(value_cols, str):
+            value_cols = [value_cols]
+        pos = locate_cells(grid_gdf, gdf.geometry.values, method=method)
+        for col in value_cols:
+            values = pd.to_numeric(gdf[col], errors='coerce').to_numpy(dtype=float)
+            valid = (pos >= 0) & ~np.isnan(values)
+            res = _group_stats(pos[valid], values[valid], n_cells, stats, quantiles)
+            for stat, arr in res.items():
+                cols[_stat_name(col, stat)] = arr
+    # alle Ergebniszellen auf einmal anhängen statt merge + fillna je Spalte
+    new = pd.DataFrame(cols, index=grid_gdf.index)
+    grid = pd.concat([grid_gdf.drop(columns=list(cols), errors='ignore'), new], axis=1)
+    grid.attrs = dict(grid_gdf.attrs)
     return grid
 
-def aggregate_demand_to_grid(grid_gdf, buildings_gdf, demand_col='waermebedarf_mw'):
-    # Option A: wenn Gebäude konkrete Nachfragewerte haben
-    joined = gpd.sjoin(buildings_gdf[[demand_col,'geometry']], grid_gdf[['cell_id','geometry']], how='inner', predicate='within')
-    agg = joined.groupby('cell_id')[demand_col].sum().rename('total_waermebedarf_mw').reset_index()
-    grid = grid_gdf.merge(agg, on='cell_id', how='left').fillna(0)
+def apportion_to_grid(grid_gdf, polygons_gdf, value_cols, chunk_size=20000):
+    # Werte von Polygonen (Gebäuden) flächenanteilig auf alle überlappten Zellen verteilen
+    if isinstance(value_cols, str):
+        value_cols = [value_cols]
+    geometry = polygons_gdf.geometry.values
+    total_area = shapely.area(geometry)
+    values = np.column_stack([np.nan_to_num(pd.to_numeric(polygons_gdf[c], errors='coerce').to_numpy(dtype=float))
+                              for c in value_cols])
+    sums = np.zeros((len(grid_gdf), len(value_cols)))
+    for idx, pos, area in overlay_areas(grid_gdf, geometry, chunk_size=chunk_size):
+        share = area / total_area[idx]
+        for k in range(len(value_cols)):
+            sums[:, k] += np.bincount(pos, weights=values[idx, k] * share, minlength=len(grid_gdf))
+    new = pd.DataFrame({f'total_{c}': sums[:, k] for k, c in enumerate(value_cols)}, index=grid_gdf.index)
+    grid = pd.concat([grid_gdf.drop(columns=list(new.columns), errors='ignore'), new], axis=1)
+    grid.attrs = dict(grid_gdf.attrs)
     return grid
-def analyze_heat_demand_balance(grid_gdf):
-    grid_gdf['net_heat_mw'] = grid_gdf['total_abwaerme_mw'] - grid_gdf['total_waermebedarf_mw']
-    return grid_gdf
\ No newline at end of file
+
+def aggregate_heat_to_grid(grid_gdf, firms_gdf, heat_col='abwaerme_mw', method='auto'):
+    # method: 'bin' (Rasterindex), 'sjoin' (räumlicher Join), 'auto' = bin wenn Grid aus create_grid
+    grid = aggregate_layers(grid_gdf.drop(columns='total_abwaerme_mw', errors='ignore'),
+                            [(firms_gdf, heat_col)], method=method)
+    return grid.rename(columns={f'total_{heat_col}': 'total_abwaerme_mw'})
+
+def aggregate_demand_to_grid(grid_gdf, buildings_gdf, demand_col='waermebedarf_mw', method='auto'):
+    # Option A: wenn Gebäude konkrete Nachfragewerte haben
+    # method='area': Gebäudepolygone flächenanteilig auf die Zellen verteilen (nichts fällt an Zellgrenzen weg)
+    grid_gdf = grid_gdf.drop(columns='total_waermebedarf_mw', errors='ignore')
+    if method == 'area':
+        grid = apportion_to_grid(grid_gdf, buildings_gdf, demand_col)
+    else:
+        grid = aggregate_layers(grid_gdf, [(buildings_gdf, demand_col)], method=method)
+    return grid.rename(columns={f'total_{demand_col}': 'total_waermebedarf_mw'})
+
+def analyze_heat_demand_balance(grid_gdf, heat_col='total_abwaerme_mw', demand_col='total_waermebedarf_mw'):
+    grid_gdf['net_heat_mw'] = grid_gdf[heat_col] - grid_gdf[demand_col]
+    return grid_gdf
+
+def stream_demand_grid(path, cell_size=1000, crs=WORKING_CRS, mask=None, batch_size=65536):
+    # Gebäude blockweise lesen (Speicher ~ batch_size), Fläche + Zellindex je Block in der
+    # metrischen Arbeits-CRS; mask in crs. Ergebnis: x, y (Zellmitte), building_area_m2, building_count
+    src_crs = pyogrio.read_info(path)['crs']
+    if mask is not None:
+        mask = transform_geometry(mask, crs, src_crs)
+    totals = None
+    with pyogrio.open_arrow(path, columns=[], mask=mask, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        for batch in reader:
+            geoms = shapely.from_wkb(batch.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+            geoms = transform_geometry(geoms, src_crs, crs)
+            x, y = shapely.get_coordinates(shapely.centroid(geoms)).T
+            part = pd.DataFrame({'kx': np.floor_divide(x, cell_size), 'ky': np.floor_divide(y, cell_size),
+                                 'building_area_m2': shapely.area(geoms), 'building_count': 1})
+            part = part.groupby(['kx', 'ky']).sum()
+            totals = part if totals is None else totals.add(part, fill_value=0)
+    if totals is None:
+        return pd.DataFrame(columns=['x', 'y', 'building_area_m2', 'building_count'])
+    totals = totals.sort_index().reset_index()
+    return pd.DataFrame({'x': (totals['kx'] + 0.5) * cell_size, 'y': (totals['ky'] + 0.5) * cell_size,
+                         'building_area_m2': totals['building_area_m2'],
+                         'building_count': totals['building_count'].astype(np.int64)})
+
+# Beispiel:
+# grid = aggregate_layers(grid, {'firms': (firms, ['abwaerme_mw', 'temperatur_c']),
+#                                'buildings': (buildings, 'waermebedarf_mw')},
+#                         stats=('sum', 'count', 'mean', 'max'), quantiles=(0.5, 0.9))
+# grid = analyze_heat_demand_balance(grid)
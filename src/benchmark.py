@@ -0,0 +1,176 @@
+# src/benchmark.py
+import asyncio
+import contextlib
+import threading
+import time
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from analysis import aggregate_demand_to_grid
+from crs import WORKING_CRS, to_crs
+from geocode import geocode_addresses
+from grid import create_grid
+from hotspot import compute_getis_ord
+from optimize import SOLVERS, optimize_allocation
+
+def _timeit(fn, *args, repeat=1, **kwargs):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+def create_grid_overlay(gdf_boundary, cell_size_m=200):
+    # bisherige Implementierung (Schleife + gpd.overlay) als Referenz
+    minx, miny, maxx, maxy = gdf_boundary.total_bounds
+    x_coords = np.arange(minx, maxx, cell_size_m)
+    y_coords = np.arange(miny, maxy, cell_size_m)
+    polys = []
+    for x in x_coords:
+        for y in y_coords:
+            polys.append(box(x, y, x+cell_size_m, y+cell_size_m))
+    grid = gpd.GeoDataFrame({'geometry':polys}, crs=gdf_boundary.crs)
+    grid = gpd.overlay(grid, gdf_boundary, how='intersection')
+    grid['cell_id'] = range(len(grid))
+    return grid
+
+def bench_create_grid(gdf_boundary, cell_sizes=(200, 100, 50, 25), repeat=1):
+    rows = []
+    for size in cell_sizes:
+        t_old, old = _timeit(create_grid_overlay, gdf_boundary, size, repeat=repeat)
+        t_new, new = _timeit(create_grid, gdf_boundary, size, repeat=repeat)
+        rows.append({'cell_size_m': size, 'cells': len(new), 'overlay_s': t_old, 'vectorized_s': t_new,
+                     'speedup': t_old / t_new, 'area_diff': abs(old.area.sum() - new.area.sum())})
+        print(rows[-1])
+    return rows
+
+def bench_apportion(buildings_gdf, gdf_boundary, cell_sizes=(200, 100, 50, 25), kwh_per_m2=50):
+    # Zentroid-Zuordnung vs. flächenanteilige Verteilung der Gebäude (z.B. geofabrik buildings)
+    buildings = buildings_gdf[['geometry']].copy()
+    buildings['waermebedarf_mw'] = buildings.geometry.area * kwh_per_m2
+    centroids = buildings.copy()
+    centroids['geometry'] = buildings.geometry.centroid
+    rows = []
+    for size in cell_sizes:
+        grid = create_grid(gdf_boundary, size)
+        t_cent, cent = _timeit(aggregate_demand_to_grid, grid, centroids)
+        t_area, area = _timeit(aggregate_demand_to_grid, grid, buildings, method='area')
+        t_within, within = _timeit(aggregate_demand_to_grid, grid, buildings, method='bin')
+        rows.append({'cell_size_m': size, 'cells': len(grid), 'centroid_s': t_cent, 'area_s': t_area,
+                     'centroid_total': cent['total_waermebedarf_mw'].sum(),
+                     'area_total': area['total_waermebedarf_mw'].sum(),
+                     'within_total': within['total_waermebedarf_mw'].sum(),
+                     'input_total': buildings['waermebedarf_mw'].sum()})
+        print(rows[-1])
+    return rows
+
+def synthetic_grid(n_cells, cell_size_m=100, seed=0):
+    # quadratisches Testgebiet mit ~n_cells Zellen und zufälligen Werten
+    side = int(np.ceil(np.sqrt(n_cells))) * cell_size_m
+    boundary = gpd.GeoDataFrame(geometry=[box(0, 0, side, side)], crs=WORKING_CRS)
+    grid = create_grid(boundary, cell_size_m)
+    rng = np.random.default_rng(seed)
+    grid['total_abwaerme_mw'] = rng.gamma(0.5, 2.0, len(grid))
+    return grid
+
+def bench_getis_ord(sizes=(10_000, 100_000, 1_000_000), k=8, permutations=999,
+                    max_permutation_cells=100_000, n_jobs=-1):
+    # bisheriger Aufruf (Permutationen, esda-Standard n_jobs=-1) vs. analytisch vs. parallel mit seed
+    rows = []
+    for n in sizes:
+        grid = synthetic_grid(n)
+        row = {'cells': len(grid)}
+        row['analytic_s'], _ = _timeit(compute_getis_ord, grid.copy(), k=k, inference='analytic')
+        if len(grid) <= max_permutation_cells:
+            row['permutation_s'], _ = _timeit(compute_getis_ord, grid.copy(), k=k, inference='permutation',
+                                              permutations=permutations, n_jobs=n_jobs)
+            row['parallel_s'], _ = _timeit(compute_getis_ord, grid.copy(), k=k, inference='parallel',
+                                           permutations=permutations, n_jobs=n_jobs, seed=0)
+        rows.append(row)
+        print(row)
+    return rows
+
+def synthetic_allocation(n_arcs, k_nearest=10, seed=0):
+    # Quellen/Senken auf 20 km x 20 km, je Quelle k_nearest Kandidaten -> ~n_arcs Arcs
+    rng = np.random.default_rng(seed)
+    n_src = max(n_arcs // k_nearest, 1)
+    n_sink = max(n_src // 4, k_nearest)
+    sources = gpd.GeoDataFrame({'id': np.arange(n_src), 'supply_mw': rng.gamma(2.0, 1.0, n_src)},
+                               geometry=gpd.points_from_xy(*rng.random((2, n_src)) * 20000), crs=WORKING_CRS)
+    demand = rng.random(n_sink)
+    sinks = gpd.GeoDataFrame({'id': np.arange(n_sink), 'demand_mw': demand / demand.sum() * sources.supply_mw.sum() * 0.5},
+                             geometry=gpd.points_from_xy(*rng.random((2, n_sink)) * 20000), crs=WORKING_CRS)
+    return sources, sinks
+
+def bench_allocation(arc_counts=(100, 1_000, 10_000, 100_000), k_nearest=10, solvers=SOLVERS):
+    # Modellaufbau und Lösung je Solver; Zielfunktion zum Vergleich (gleiches Optimum erwartet)
+    rows = []
+    for n_arcs in arc_counts:
+        sources, sinks = synthetic_allocation(n_arcs, k_nearest)
+        for solver in solvers:
+            timings = {}
+            t, flows = _timeit(optimize_allocation, sources, sinks, k_nearest=k_nearest, solver=solver, timings=timings)
+            src_xy = np.column_stack([sources.geometry.x, sources.geometry.y])
+            sink_xy = np.column_stack([sinks.geometry.x, sinks.geometry.y])
+            cost = sum(f['flow_mw'] * np.hypot(*(src_xy[f['source']] - sink_xy[f['sink']])) / 1000 for f in flows)
+            rows.append({'arcs': len(sources) * k_nearest, 'solver': solver, 'total_s': t, **timings, 'objective': cost})
+            print(rows[-1])
+    return rows
+
+@contextlib.contextmanager
+def stub_geocoder(latency=0.02, fail_every=10, fail_status=429):
+    # lokaler Nominatim-Ersatz (aiohttp.web) in eigenem Thread: feste Latenz, jede fail_every-te
+    # Anfrage fail_status (429 mit Retry-After); liefert die URL
+    from aiohttp import web
+    count = {'n': 0}
+
+    async def search(request):
+        count['n'] += 1
+        await asyncio.sleep(latency)
+        if fail_every and count['n'] % fail_every == 0:
+            return web.Response(status=fail_status, headers={'Retry-After': '0.05'} if fail_status == 429 else {})
+        return web.json_response([{'lat': '53.08', 'lon': '8.80', 'display_name': request.query['q']}])
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get('/search', search)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{port}/search'
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+def bench_geocode(n_addresses=500, latency=0.02, fail_every=10, concurrency=(1, 8, 32, 128), rate=10_000):
+    # seriell (concurrency=1, wie code_all ohne Pause) vs. asynchron parallel gegen den Stub-Server
+    addresses = [f'Teststraße {i}, 28195 Bremen' for i in range(n_addresses)]
+    rows = []
+    with stub_geocoder(latency, fail_every) as url:
+        for c in concurrency:
+            t, results = _timeit(geocode_addresses, addresses, url=url, rate=rate, burst=c, concurrency=c,
+                                 backoff=0.05)
+            rows.append({'addresses': n_addresses, 'concurrency': c, 'seconds': t, 'req_per_s': n_addresses / t,
+                         'ok': sum(r.status == 'ok' for r in results.values())})
+            print(rows[-1])
+    return rows
+
+if __name__ == "__main__":
+    import sys
+    bremen = to_crs(gpd.read_file(sys.argv[1]), WORKING_CRS)
+    bench_create_grid(bremen)
+    buildings = to_crs(gpd.read_file('geofabrik bremen/gis_osm_buildings_a_free_1.shp'), WORKING_CRS)
+    bench_apportion(buildings, bremen)
+    bench_getis_ord()
+    bench_allocation()
+    bench_geocode()
@@ -0,0 +1,65 @@
+# src/cache.py
+import glob
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+
+CACHE_DIR = 'data/cache'
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+def _source_files(path):
+    # Shapefile besteht aus mehreren Dateien, alle gehören zum Schlüssel
+    stem, ext = os.path.splitext(path)
+    if ext.lower() != '.shp':
+        return [path]
+    return [stem + e for e in SHAPEFILE_PARTS if os.path.exists(stem + e)]
+
+def _file_hash(path, cache_dir):
+    # Inhalts-Hash, gemerkt pro (Pfad, Größe, mtime) damit große Dateien nicht jedes Mal gelesen werden
+    index_path = os.path.join(cache_dir, 'hashes.json')
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    st = os.stat(path)
+    stamp = f'{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}'
+    if stamp in index:
+        return index[stamp]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    index[stamp] = h.hexdigest()
+    tmp = index_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    return index[stamp]
+
+def cache_key(path, cache_dir=CACHE_DIR, **params):
+    # Schlüssel = Hash der Quelldateien + Ziel-CRS, Spaltenauswahl usw.
+    os.makedirs(cache_dir, exist_ok=True)
+    parts = {os.path.basename(p): _file_hash(p, cache_dir) for p in _source_files(path)}
+    parts.update({k: str(v) for k, v in sorted(params.items())})
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:20]
+
+def cached_layer(path, loader, cache_dir=CACHE_DIR, **params):
+    # geladenen + reprojizierten Layer als Arrow (Feather, unkomprimiert) ablegen, Lesen per memory map
+    if cache_dir is None:
+        return loader()
+    stem = os.path.splitext(os.path.basename(path))[0].replace(' ', '_')
+    cache_path = os.path.join(cache_dir, f'{stem}-{cache_key(path, cache_dir, **params)}.arrow')
+    if os.path.exists(cache_path):
+        return gpd.read_feather(cache_path, memory_map=True)
+    gdf = loader()
+    tmp = cache_path + '.tmp'
+    gdf.to_feather(tmp, compression='uncompressed')
+    os.replace(tmp, cache_path)
+    return gdf
+
+def clear_cache(cache_dir=CACHE_DIR):
+    for p in glob.glob(os.path.join(cache_dir, '*.arrow')) + glob.glob(os.path.join(cache_dir, 'hashes.json')):
+        os.remove(p)
@@ -1,16 +1,119 @@
 # src/clustering.py
+import geopandas as gpd
 import numpy as np
+import shapely
+from scipy import ndimage
 from sklearn.cluster import DBSCAN
 
-def cluster_hotspots(grid_gdf, score_col='combined_score', eps=300, min_samples=3):
+from grid import grid_spec, grid_to_array
+
+# method='dbscan' - DBSCAN auf Zellmittelpunkten (eps in Metern)
+# method='grid'   - Zusammenhangskomponenten direkt auf dem Gitterindex (ix/iy),
+#                   connectivity 'queen' (8 Nachbarn) oder 'rook' (4), Komponenten < min_size -> -1
+CONNECTIVITY = {'rook': 1, 'queen': 2}
+
+def cluster_hotspots(grid_gdf, score_col='combined_score', eps=300, min_samples=3, threshold=0.2,
+                     method='dbscan', connectivity='queen', min_size=1):
     # filter candidate cells
-    cand = grid_gdf[grid_gdf[score_col] > 0.2].copy()  # threshold anpassen
-    coords = np.array(list(zip(cand.geometry.centroid.x, cand.geometry.centroid.y)))
+    cand = grid_gdf[grid_gdf[score_col] > threshold].copy()
+    if method not in ('dbscan', 'grid'):
+        raise ValueError("method must be 'dbscan' or 'grid'")
+    if method == 'grid':
+        cand['cluster'] = _grid_labels(grid_gdf, score_col, threshold, connectivity, min_size, cand)
+        return cand
+    if len(cand) == 0:
+        # keine Zelle über threshold -> 0 Cluster (DBSCAN lehnt leere Eingaben ab)
+        cand['cluster'] = np.empty(0, dtype=np.int64)
+        return cand
+    coords = shapely.get_coordinates(shapely.centroid(cand.geometry.values))
     db = DBSCAN(eps=eps, min_samples=min_samples).fit(coords)
     cand['cluster'] = db.labels_
     # -1 = noise
     return cand
 
-# Export clusters as polygons by dissolving grid cells per cluster
+def _grid_labels(grid_gdf, score_col, threshold, connectivity, min_size, cand):
+    if connectivity not in CONNECTIVITY:
+        raise ValueError(f"connectivity must be one of {tuple(CONNECTIVITY)}")
+    score, present = grid_to_array(grid_gdf, score_col)
+    structure = ndimage.generate_binary_structure(2, CONNECTIVITY[connectivity])
+    labels, n = ndimage.label(present & (score > threshold), structure=structure)
+    # zu kleine Komponenten verwerfen, Rest fortlaufend 0..k-1 nummerieren
+    sizes = np.bincount(labels.ravel(), minlength=n + 1)
+    keep = sizes >= min_size
+    keep[0] = False
+    relabel = np.full(n + 1, -1)
+    relabel[keep] = np.arange(keep.sum())
+    return relabel[labels[cand['ix'].values.astype(np.int64), cand['iy'].values.astype(np.int64)]]
+
+def _cell_runs(ix, iy, cluster):
+    # zusammenhängende iy-Läufe je (cluster, ix) -> ein Rechteck pro Lauf statt einer Zelle
+    order = np.lexsort((iy, ix, cluster))
+    ix, iy, cluster = ix[order], iy[order], cluster[order]
+    start = np.ones(len(ix), dtype=bool)
+    start[1:] = (cluster[1:] != cluster[:-1]) | (ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1] + 1)
+    first = np.flatnonzero(start)
+    last = np.append(first[1:], len(ix)) - 1
+    return ix[first], iy[first], iy[last], cluster[first]
+
+def _run_polygons(spec, ix, iy0, iy1):
+    # Lauf-Rechtecke mit Stützpunkt an jeder Zellgrenze der Längsseiten, damit sie mit den
+    # Nachbarspalten eine saubere Coverage bilden (Voraussetzung für coverage_union)
+    size = spec['cell_size']
+    n = iy1 - iy0 + 1
+    per_ring = 2 * (n + 1) + 1
+    ring = np.repeat(np.arange(len(n)), per_ring)
+    pos = np.arange(len(ring)) - np.repeat(np.cumsum(per_ring) - per_ring, per_ring)
+    m = np.repeat(n, per_ring)
+    right = (pos > m) & (pos <= 2 * m + 1)
+    k = np.where(right, 2 * m + 1 - pos, np.minimum(pos, m))
+    k[pos == 2 * m + 2] = 0
+    x = spec['x0'] + (ix[ring] + right) * size
+    y = spec['y0'] + (iy0[ring] + k) * size
+    return shapely.polygons(shapely.linearrings(np.column_stack([x, y]), indices=ring))
+
+def _cluster_geometries(cells, cluster_col):
+    # ungeclippte Zellen als Läufe, am Rand geclippte Zellen mit ihrer echten Geometrie,
+    # je Cluster per coverage_union (kantenteilende Teile, keine allgemeine Verschneidung)
+    spec = grid_spec(cells)
+    cluster = cells[cluster_col].values.astype(np.int64)
+    clipped = cells['clipped'].values.astype(bool) if 'clipped' in cells else np.zeros(len(cells), dtype=bool)
+    ix, iy0, iy1, run_cluster = _cell_runs(cells['ix'].values[~clipped].astype(np.int64),
+                                           cells['iy'].values[~clipped].astype(np.int64), cluster[~clipped])
+    geoms = np.concatenate([_run_polygons(spec, ix, iy0, iy1), cells.geometry.values[clipped]])
+    owner = np.concatenate([run_cluster, cluster[clipped]])
+    order = np.argsort(owner, kind='stable')
+    ids, starts = np.unique(owner[order], return_index=True)
+    parts = np.split(geoms[order], starts[1:])
+    return ids, [shapely.coverage_union_all(p) for p in parts]
+
+def cluster_polygons(clusters_gdf, cluster_col='cluster'):
+    # ein Polygon je Cluster (ersetzt dissolve(by='cluster'))
+    cells = clusters_gdf[clusters_gdf[cluster_col] >= 0]
+    ids, geoms = _cluster_geometries(cells, cluster_col)
+    n_cells = np.bincount(cells[cluster_col].values.astype(np.int64))[ids]
+    return gpd.GeoDataFrame({cluster_col: ids, 'n_cells': n_cells}, geometry=geoms, crs=clusters_gdf.crs)
+
+def summarize_clusters(clusters_gdf, cluster_col='cluster', sum_cols=('total_abwaerme_mw', 'total_waermebedarf_mw', 'net_heat_mw'),
+                       score_col='combined_score'):
+    # Cluster-Polygone + Kennzahlen je Cluster in einem Durchgang (statt dissolve + groupby):
+    # Summen der sum_cols, Zellzahl, Fläche, Spitzenwert von score_col
+    cells = clusters_gdf[clusters_gdf[cluster_col] >= 0]
+    ids, geoms = _cluster_geometries(cells, cluster_col)
+    cluster = cells[cluster_col].values.astype(np.int64)
+    size = ids.max() + 1 if len(ids) else 0
+    data = {cluster_col: ids, 'n_cells': np.bincount(cluster, minlength=size)[ids]}
+    for col in sum_cols:
+        if col in cells:
+            data[col] = np.bincount(cluster, weights=np.nan_to_num(cells[col].to_numpy(dtype=float)), minlength=size)[ids]
+    data['area_m2'] = np.bincount(cluster, weights=shapely.area(cells.geometry.values), minlength=size)[ids]
+    if score_col in cells:
+        peak = np.full(size, -np.inf)
+        np.fmax.at(peak, cluster, cells[score_col].to_numpy(dtype=float))
+        data[f'peak_{score_col}'] = peak[ids]
+    return gpd.GeoDataFrame(data, geometry=geoms, crs=clusters_gdf.crs)
+
+# Export clusters as polygons
 # clusters = cluster_hotspots(grid)
-# cluster_polys = clusters[clusters.cluster!=-1].dissolve(by='cluster')
+# clusters = cluster_hotspots(grid, method='grid', connectivity='rook', min_size=3)
+# cluster_polys = cluster_polygons(clusters)
+# cluster_stats = summarize_clusters(clusters)  # Polygone + Summen, Fläche, Spitzenwert je Cluster
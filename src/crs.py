@@ -0,0 +1,73 @@
+# src/crs.py
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+
+# eine metrische Arbeits-CRS für alle Layer (Abstände/Flächen in Metern), Geographisch nur für Export
+WORKING_CRS = 'EPSG:25832'  # ETRS89 / UTM 32N
+GEOGRAPHIC_CRS = 'EPSG:4326'
+
+@lru_cache(maxsize=None)
+def _transformer(src, dst):
+    return Transformer.from_crs(CRS.from_user_input(src), CRS.from_user_input(dst), always_xy=True)
+
+def get_transformer(src, dst):
+    # Transformer einmal je (Quell-, Ziel-CRS) bauen und wiederverwenden
+    return _transformer(CRS.from_user_input(src).to_wkt(), CRS.from_user_input(dst).to_wkt())
+
+def same_crs(a, b):
+    return CRS.from_user_input(a) == CRS.from_user_input(b)
+
+def transform_xy(x, y, src, dst):
+    return get_transformer(src, dst).transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+def transform_geometry(geoms, src, dst):
+    if same_crs(src, dst):
+        return geoms
+    tr = get_transformer(src, dst)
+    return shapely.transform(geoms, lambda xy: np.column_stack(tr.transform(xy[:, 0], xy[:, 1])))
+
+def to_crs(gdf, crs=WORKING_CRS):
+    # wie GeoDataFrame.to_crs, aber mit gecachtem Transformer und ohne Arbeit bei gleicher CRS
+    if gdf.crs is not None and same_crs(gdf.crs, crs):
+        return gdf
+    out = gdf.copy()
+    out = out.set_geometry(transform_geometry(gdf.geometry.values, gdf.crs, crs), crs=crs)
+    return out
+
+class LayerRegistry:
+    # alle Layer in der Arbeits-CRS; geographische Kopien nur bei Bedarf (Export) und gecacht
+
+    def __init__(self, crs=WORKING_CRS):
+        self.crs = crs
+        self._layers = {}
+        self._geographic = {}
+
+    def add(self, name, gdf):
+        self._layers[name] = to_crs(gdf, self.crs)
+        self._geographic.pop(name, None)
+        return self._layers[name]
+
+    def __getitem__(self, name):
+        return self._layers[name]
+
+    def __contains__(self, name):
+        return name in self._layers
+
+    def names(self):
+        return list(self._layers)
+
+    def geographic(self, name):
+        if name not in self._geographic:
+            self._geographic[name] = to_crs(self._layers[name], GEOGRAPHIC_CRS)
+        return self._geographic[name]
+
+    def export(self, name, path, columns=None, driver='GeoJSON'):
+        # columns: {Spalte: Exportname}, Geometrie wird immer mitgeschrieben
+        gdf = self.geographic(name)
+        if columns is not None:
+            gdf = gdf[list(columns) + [gdf.geometry.name]].rename(columns=columns)
+        gdf.to_file(path, driver=driver)
+        return gdf
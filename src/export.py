@@ -1,2 +1,6 @@
+from clustering import summarize_clusters
+
 grid.to_file("results/bremen_grid_with_scores.gpkg", layer="grid", driver="GPKG")
 clusters.to_file("results/clusters.gpkg", layer="clusters", driver="GPKG")
+# Cluster-Polygone mit Summen je Cluster (Wärme, Bedarf, Netto, Zellen, Fläche, Spitzenwert)
+summarize_clusters(clusters).to_file("results/clusters.gpkg", layer="cluster_polygons", driver="GPKG")
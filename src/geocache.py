@@ -0,0 +1,143 @@
+# src/geocache.py
+import os
+import pickle
+import re
+import sqlite3
+import time
+import unicodedata
+
+# Geocoding-Cache in SQLite (WAL): jedes Ergebnis wird gepuffert und blockweise geschrieben,
+# ein Absturz verliert höchstens den letzten Block; mehrere Prozesse können parallel lesen.
+# Schlüssel = normalisierte Adresse, dazu Anbieter, Zeitstempel, Status und Anzahl Versuche,
+# damit fehlgeschlagene Anfragen ('error') gezielt wiederholt werden können.
+GEOCACHE_PATH = 'data/geocoding/geocoding_cache.sqlite'
+BATCH_SIZE = 100
+STATUSES = ('ok', 'not_found', 'error')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocode (
+    key      TEXT PRIMARY KEY,
+    address  TEXT NOT NULL,
+    lat      REAL,
+    lon      REAL,
+    status   TEXT NOT NULL,
+    provider TEXT,
+    updated  REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1
+)"""
+
+_UPSERT = """
+INSERT INTO geocode (key, address, lat, lon, status, provider, updated, attempts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET address=excluded.address, lat=excluded.lat, lon=excluded.lon,
+    status=excluded.status, provider=excluded.provider, updated=excluded.updated,
+    attempts=geocode.attempts + excluded.attempts"""
+
+def normalize_address(address):
+    # 'Düsseldorfer Straße 121, 40721  Hilden' == 'düsseldorfer str. 121 40721 hilden'
+    a = unicodedata.normalize('NFKC', str(address)).lower()
+    a = re.sub(r'stra(ß|ss)e\b', 'str', a)
+    a = re.sub(r'\bstr\b\.?', 'str', a)
+    a = re.sub(r'[^\w]+', ' ', a)
+    return ' '.join(a.split())
+
+class GeocodeCache:
+
+    def __init__(self, path=GEOCACHE_PATH, batch_size=BATCH_SIZE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self.con = sqlite3.connect(path, timeout=30)
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+        self.con.execute(_SCHEMA)
+        self.con.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        return self.con.execute('SELECT COUNT(*) FROM geocode').fetchone()[0]
+
+    def _rows(self, addresses):
+        # ein Eintrag je Eingabeadresse, auch wenn mehrere Schreibweisen denselben Schlüssel haben
+        keys = {}
+        for a in dict.fromkeys(addresses):
+            keys.setdefault(normalize_address(a), []).append(a)
+        out = {}
+        items = list(keys)
+        # SQLite-Parametergrenze: in Blöcken abfragen
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            sql = f"SELECT key, lat, lon, status, attempts FROM geocode WHERE key IN ({','.join('?' * len(chunk))})"
+            for key, lat, lon, status, attempts in self.con.execute(sql, chunk):
+                out.update(dict.fromkeys(keys[key], (lat, lon, status, attempts)))
+        return out
+
+    def get_many(self, addresses, include_failed=False):
+        # {address: (lat, lon)} für bekannte Adressen (ok und not_found; 'error' nur mit include_failed)
+        self.flush()
+        return {a: (lat, lon) for a, (lat, lon, status, _) in self._rows(addresses).items()
+                if include_failed or status != 'error'}
+
+    def get(self, address, default=None):
+        return self.get_many([address]).get(address, default)
+
+    def pending(self, addresses, retry_failed=True, max_attempts=None):
+        # Adressen, die (noch) nachgeschlagen werden müssen: unbekannt oder - mit retry_failed -
+        # zuletzt fehlgeschlagen und weniger als max_attempts Versuche
+        self.flush()
+        rows = self._rows(addresses)
+        out = []
+        for a in dict.fromkeys(addresses):
+            row = rows.get(a)
+            if row is None:
+                out.append(a)
+            elif row[2] == 'error' and retry_failed and (max_attempts is None or row[3] < max_attempts):
+                out.append(a)
+        return out
+
+    def put(self, address, lat, lon, status='ok', provider=None):
+        if status not in STATUSES:
+            raise ValueError(f"status must be one of {STATUSES}")
+        self._pending.append((normalize_address(address), str(address), lat, lon, status, provider, time.time(), 1))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.con:
+                self.con.executemany(_UPSERT, self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self.con.close()
+
+    def stats(self):
+        self.flush()
+        return dict(self.con.execute('SELECT status, COUNT(*) FROM geocode GROUP BY status').fetchall())
+
+    def import_pickle(self, path, provider='nominatim'):
+        # alter dict-Cache {address: (lat, lon)}; (None, None) war dort nicht von Fehlern zu
+        # unterscheiden -> als 'error' übernehmen, damit diese Adressen erneut versucht werden
+        with open(path, 'rb') as f:
+            legacy = pickle.load(f)
+        stamp = os.path.getmtime(path)
+        rows = [(normalize_address(a), str(a), lat, lon, 'error' if lat is None else 'ok', provider, stamp, 1)
+                for a, (lat, lon) in legacy.items()]
+        with self.con:
+            self.con.executemany(_UPSERT, rows)
+        return len(rows)
+
+# Beispiel:
+# with GeocodeCache() as cache:
+#     todo = cache.pending(df['Adresse'].unique())
+#     results = geocode_addresses(todo, on_result=lambda a, r: cache.put(a, r.lat, r.lon, r.status, 'nominatim'))
+#     coords = cache.get_many(df['Adresse'])
@@ -0,0 +1,107 @@
+# src/geocode.py
+import asyncio
+import time
+from collections import namedtuple
+
+import aiohttp
+
+# Asynchrones Batch-Geocoding: eine HTTP-Session (Connection-Pool) je Endpoint, Token-Bucket für
+# das Anfragetempo, Retries mit Backoff bei 429/5xx (Retry-After wird beachtet).
+# Öffentliches Nominatim erlaubt 1 Anfrage/s -> rate=1; eigene Nominatim/Photon-Instanz: rate hoch.
+ENDPOINTS = {'nominatim': 'https://nominatim.openstreetmap.org/search',
+             'photon': 'https://photon.komoot.io/api/'}
+USER_AGENT = 'wasteheat_geocoder'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# status: 'ok', 'not_found' (Dienst kennt die Adresse nicht), 'error' (nach allen Retries gescheitert)
+Geocoded = namedtuple('Geocoded', ['lat', 'lon', 'status'])
+
+class TokenBucket:
+    # rate Anfragen pro Sekunde, bis zu burst auf einmal
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _request(provider, address):
+    if provider == 'nominatim':
+        return {'q': address, 'format': 'jsonv2', 'limit': 1}
+    return {'q': address, 'limit': 1}
+
+def _parse(provider, data):
+    if provider == 'nominatim':
+        return (float(data[0]['lat']), float(data[0]['lon'])) if data else None
+    features = data.get('features') or []
+    if not features:
+        return None
+    lon, lat = features[0]['geometry']['coordinates'][:2]
+    return float(lat), float(lon)
+
+def _retry_after(response, default):
+    try:
+        return max(float(response.headers.get('Retry-After', default)), 0.0)
+    except ValueError:
+        return default
+
+async def _geocode_one(session, bucket, provider, url, address, retries, backoff):
+    for attempt in range(retries + 1):
+        wait = backoff * 2 ** attempt
+        await bucket.acquire()
+        try:
+            async with session.get(url, params=_request(provider, address)) as response:
+                if response.status in RETRY_STATUS:
+                    wait = _retry_after(response, wait)
+                elif response.status >= 400:
+                    # sonstige Client-Fehler (falsche URL, 403 ...) wiederholen bringt nichts
+                    return Geocoded(None, None, 'error')
+                else:
+                    coords = _parse(provider, await response.json(content_type=None))
+                    return Geocoded(*coords, 'ok') if coords else Geocoded(None, None, 'not_found')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError):
+            pass
+        if attempt < retries:
+            await asyncio.sleep(wait)
+    return Geocoded(None, None, 'error')
+
+async def geocode_async(addresses, provider='nominatim', url=None, rate=1.0, burst=1, concurrency=4, retries=4,
+                        backoff=1.0, timeout=10, user_agent=USER_AGENT, on_result=None):
+    # addresses -> {address: Geocoded}; on_result(address, Geocoded) wird je fertigem Ergebnis gerufen
+    # (Fortschritt, Cache schreiben). url überschreibt den Endpoint (lokale Instanz, Stub-Server)
+    if provider not in ENDPOINTS:
+        raise ValueError(f"provider must be one of {tuple(ENDPOINTS)}")
+    url = url or ENDPOINTS[provider]
+    bucket = TokenBucket(rate, burst)
+    limit = asyncio.Semaphore(concurrency)
+    results = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers={'User-Agent': user_agent},
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def run(address):
+            async with limit:
+                result = await _geocode_one(session, bucket, provider, url, address, retries, backoff)
+            results[address] = result
+            if on_result is not None:
+                on_result(address, result)
+        await asyncio.gather(*(run(a) for a in dict.fromkeys(addresses)))
+    return results
+
+def geocode_addresses(addresses, **kwargs):
+    # synchroner Einstieg für Skripte (eigene Event-Loop)
+    return asyncio.run(geocode_async(addresses, **kwargs))
+
+# Beispiel: results = geocode_addresses(df['Adresse'].unique())                       # öffentliches Nominatim, 1/s
+#           results = geocode_addresses(addrs, url='http://localhost:8080/search', rate=200, burst=20,
+#                                       concurrency=32)                               # lokale Instanz
@@ -1,25 +1,185 @@
 # src/grid.py
 import geopandas as gpd
-from shapely.geometry import box
 import numpy as np
+import shapely
+from scipy import ndimage, signal
 
-def create_grid(gdf_boundary, cell_size_m=200):
-    # boundary in metric CRS
-    bounds = gdf_boundary.total_bounds  # minx, miny, maxx, maxy
+def _boundary_geometry(gdf_boundary):
+    # alle Grenzpolygone zu einer (vorbereiteten) Geometrie zusammenfassen
+    geom = shapely.union_all(gdf_boundary.geometry.values)
+    shapely.prepare(geom)
+    return geom
+
+def _polygonal(geoms):
+    # Schnitt Box/Grenze kann GeometryCollections mit Linien/Punkten liefern -> nur Flächen behalten
+    coll = shapely.get_type_id(geoms) == 7
+    for i in np.flatnonzero(coll):
+        parts = shapely.get_parts(geoms[i])
+        parts = parts[np.isin(shapely.get_type_id(parts), (3, 6))]
+        geoms[i] = shapely.union_all(parts)
+    return geoms
+
+def _clip_cells(cells, boundary):
+    # Zellen komplett innerhalb bleiben unverändert, nur Randzellen werden geschnitten
+    inside = shapely.contains(boundary, cells)
+    edge = ~inside & shapely.intersects(boundary, cells)
+    clipped = _polygonal(shapely.intersection(cells[edge], boundary))
+    keep_edge = shapely.area(clipped) > 0
+    geoms = cells.copy()
+    geoms[np.flatnonzero(edge)] = clipped
+    keep = inside.copy()
+    keep[np.flatnonzero(edge)[keep_edge]] = True
+    return geoms, keep, edge
+
+def _build_grid(boundary, bounds, cell_size_m, crs):
     minx, miny, maxx, maxy = bounds
-    # generate grid
     x_coords = np.arange(minx, maxx, cell_size_m)
     y_coords = np.arange(miny, maxy, cell_size_m)
-    polys = []
-    for x in x_coords:
-        for y in y_coords:
-            polys.append(box(x, y, x+cell_size_m, y+cell_size_m))
-    grid = gpd.GeoDataFrame({'geometry':polys}, crs=gdf_boundary.crs)
-    # clip to boundary
-    grid = gpd.overlay(grid, gdf_boundary, how='intersection')
-    grid['cell_id'] = range(len(grid))
+    # alle Zellen in einem Schritt (Reihenfolge wie bisher: x außen, y innen)
+    ix, iy = np.meshgrid(np.arange(len(x_coords)), np.arange(len(y_coords)), indexing='ij')
+    ix, iy = ix.ravel(), iy.ravel()
+    x0, y0 = x_coords[ix], y_coords[iy]
+    cells = shapely.box(x0, y0, x0 + cell_size_m, y0 + cell_size_m)
+    geoms, keep, edge = _clip_cells(cells, boundary)
+    grid = gpd.GeoDataFrame({'ix': ix[keep], 'iy': iy[keep], 'clipped': edge[keep]},
+                            geometry=geoms[keep], crs=crs)
+    grid.insert(0, 'cell_id', np.arange(len(grid)))
+    grid.attrs['grid'] = {'x0': float(minx), 'y0': float(miny), 'cell_size': float(cell_size_m),
+                          'nx': len(x_coords), 'ny': len(y_coords)}
     return grid
 
+def create_grid(gdf_boundary, cell_size_m=200):
+    # boundary in metric CRS
+    boundary = _boundary_geometry(gdf_boundary)
+    return _build_grid(boundary, gdf_boundary.total_bounds, cell_size_m, gdf_boundary.crs)
+
+def create_grids(gdf_boundary, cell_sizes=(200, 100, 50, 25)):
+    # mehrere Auflösungen, Grenzgeometrie wird nur einmal vorbereitet
+    boundary = _boundary_geometry(gdf_boundary)
+    bounds = gdf_boundary.total_bounds
+    return {size: _build_grid(boundary, bounds, size, gdf_boundary.crs) for size in cell_sizes}
+
+def grid_spec(grid_gdf):
+    # Rasterparameter (Ursprung, Zellgröße, Ausdehnung) eines Grids aus create_grid
+    spec = grid_gdf.attrs.get('grid')
+    if spec is not None:
+        return spec
+    if not {'ix', 'iy', 'clipped'}.issubset(grid_gdf.columns):
+        return None
+    # attrs gehen z.B. beim Einlesen aus GPKG verloren -> aus einer ungeschnittenen Zelle ableiten
+    full = grid_gdf[~grid_gdf['clipped'].astype(bool)]
+    if len(full) == 0:
+        return None
+    minx, miny, maxx, _ = full.geometry.iloc[0].bounds
+    size = maxx - minx
+    row = full.iloc[0]
+    return {'x0': float(minx - row['ix'] * size), 'y0': float(miny - row['iy'] * size), 'cell_size': size,
+            'nx': int(grid_gdf['ix'].max()) + 1, 'ny': int(grid_gdf['iy'].max()) + 1}
+
+def flat_index(grid_gdf, spec):
+    # flacher Index (x außen, y innen) jeder Zelle im vollen Raster
+    return grid_gdf['ix'].values.astype(np.int64) * spec['ny'] + grid_gdf['iy'].values.astype(np.int64)
+
+def grid_to_array(grid_gdf, value_col, fill=np.nan):
+    # Spalte als dichtes (nx, ny)-Raster (x außen, y innen wie ix/iy) + Maske vorhandener Zellen
+    spec = grid_spec(grid_gdf)
+    if spec is None:
+        raise ValueError("raster access needs a grid from create_grid (ix/iy columns)")
+    ix = grid_gdf['ix'].values.astype(np.int64)
+    iy = grid_gdf['iy'].values.astype(np.int64)
+    arr = np.full((spec['nx'], spec['ny']), fill, dtype=float)
+    mask = np.zeros((spec['nx'], spec['ny']), dtype=bool)
+    arr[ix, iy] = grid_gdf[value_col].to_numpy(dtype=float)
+    mask[ix, iy] = True
+    return arr, mask
+
+def hotspot_kernel(kind='queen', cell_size=1.0, radius=None, sigma=None):
+    # Nachbarschaftsgewichte als 2-D Kernel (Zentrum = Zelle selbst) für Gi* und Erreichbarkeit;
+    # radius, sigma in derselben Einheit wie cell_size (m)
+    #   'queen'/'rook' - direkte Nachbarn, 'distance' - alle Zellen mit Mittelpunktabstand <= radius,
+    #   'gaussian'     - exp(-d^2 / 2 sigma^2), abgeschnitten bei radius (Standard 3 sigma)
+    #   'exponential'  - exp(-d / sigma), abgeschnitten bei radius (Standard 5 sigma)
+    if kind == 'queen':
+        return np.ones((3, 3))
+    if kind == 'rook':
+        return np.array([[0., 1., 0.], [1., 1., 1.], [0., 1., 0.]])
+    if kind in ('gaussian', 'exponential'):
+        radius = (3 if kind == 'gaussian' else 5) * sigma if radius is None else radius
+    elif kind != 'distance':
+        raise ValueError(f"unknown kernel {kind!r}")
+    r = int(np.floor(radius / cell_size))
+    off = np.arange(-r, r + 1) * cell_size
+    d2 = off[:, None] ** 2 + off[None, :] ** 2
+    inside = d2 <= radius ** 2
+    if kind == 'distance':
+        return inside.astype(float)
+    if kind == 'exponential':
+        return np.where(inside, np.exp(-np.sqrt(d2) / sigma), 0.0)
+    return np.where(inside, np.exp(-d2 / (2 * sigma ** 2)), 0.0)
+
+def neighbour_sum(arr, kernel):
+    # gewichtete Nachbarschaftssumme auf dem (nx, ny)-Raster (Kernel-Zentrum = Zelle selbst);
+    # kleine Kernel direkt, große per FFT (beides linear in der Zellzahl bei festem Kernel)
+    if kernel.size <= 81:
+        return ndimage.correlate(arr, kernel, mode='constant', cval=0.0)
+    return signal.fftconvolve(arr, kernel[::-1, ::-1], mode='same')
+
+def _sjoin_cells(grid_gdf, geometry):
+    pts = gpd.GeoDataFrame(geometry=np.asarray(geometry), crs=grid_gdf.crs)
+    cells = gpd.GeoDataFrame(geometry=grid_gdf.geometry.values, crs=grid_gdf.crs)
+    joined = gpd.sjoin(pts, cells, how='inner', predicate='within')
+    joined = joined[~joined.index.duplicated()]
+    pos = np.full(len(pts), -1, dtype=np.int64)
+    pos[joined.index.values] = joined['index_right'].values
+    return pos
+
+def locate_cells(grid_gdf, geometry, method='auto'):
+    # Zeilenposition der Grid-Zelle, in der jede Geometrie liegt ('within'), -1 = keine
+    geometry = np.asarray(geometry)
+    spec = grid_spec(grid_gdf)
+    if method == 'sjoin' or (method == 'auto' and spec is None):
+        return _sjoin_cells(grid_gdf, geometry)
+    if spec is None:
+        raise ValueError("binning needs a grid from create_grid (ix/iy columns)")
+    # reguläres Raster: Zelle per Ganzzahl-Division, Flächen nur wenn sie in genau eine Zelle fallen
+    bounds = shapely.bounds(geometry)
+    size, nx, ny = spec['cell_size'], spec['nx'], spec['ny']
+    lo_x = np.floor((bounds[:, 0] - spec['x0']) / size)
+    lo_y = np.floor((bounds[:, 1] - spec['y0']) / size)
+    hi_x = np.floor((bounds[:, 2] - spec['x0']) / size)
+    hi_y = np.floor((bounds[:, 3] - spec['y0']) / size)
+    ok = (lo_x == hi_x) & (lo_y == hi_y) & (lo_x >= 0) & (lo_x < nx) & (lo_y >= 0) & (lo_y < ny)
+    lookup = np.full(nx * ny, -1, dtype=np.int64)
+    lookup[flat_index(grid_gdf, spec)] = np.arange(len(grid_gdf))
+    pos = np.full(len(geometry), -1, dtype=np.int64)
+    pos[ok] = lookup[lo_x[ok].astype(np.int64) * ny + lo_y[ok].astype(np.int64)]
+    # geometrischer Test nur für Zellen, die an der Grenze geschnitten wurden
+    clipped = grid_gdf['clipped'].values.astype(bool)
+    check = np.flatnonzero(pos >= 0)
+    check = check[clipped[pos[check]]]
+    if len(check):
+        inside = shapely.within(geometry[check], grid_gdf.geometry.values[pos[check]])
+        pos[check[~inside]] = -1
+    return pos
+
+def overlay_areas(grid_gdf, geometry, chunk_size=20000):
+    # Schnittflächen Polygon x Zelle in Blöcken (Speicher ~ chunk_size, nicht Anzahl Gebäude x Zellen)
+    # liefert je Block (Polygon-Index, Zellposition, Schnittfläche)
+    geometry = np.asarray(geometry)
+    cells = grid_gdf.geometry.values
+    clipped = grid_gdf['clipped'].values.astype(bool) if 'clipped' in grid_gdf else np.ones(len(cells), bool)
+    tree = shapely.STRtree(cells)
+    for start in range(0, len(geometry), chunk_size):
+        chunk = geometry[start:start + chunk_size]
+        idx, pos = tree.query(chunk, predicate='intersects')
+        # Polygone, die nur eine ungeschnittene Zelle berühren, liegen ganz darin -> kein Schnitt nötig
+        single = (np.bincount(idx, minlength=len(chunk)) == 1)[idx] & ~clipped[pos]
+        area = shapely.area(chunk[idx])
+        area[~single] = shapely.area(shapely.intersection(chunk[idx[~single]], cells[pos[~single]]))
+        keep = area > 0
+        yield idx[keep] + start, pos[keep], area[keep]
+
 # Beispiel:
 # grid = create_grid(bremen, cell_size_m=200)
-# grid.to_file("data/bremen_grid_200m.gpkg", layer="grid", driver="GPKG")
\ No newline at end of file
+# grids = create_grids(bremen, cell_sizes=(200, 100, 50, 25))
+# grid.to_file("data/bremen_grid_200m.gpkg", layer="grid", driver="GPKG")
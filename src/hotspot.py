@@ -1,23 +1,112 @@
 # src/hotspot.py
-import libpysal
 from esda import G_Local
 import numpy as np
 import geopandas as gpd
+import pandas as pd
+from scipy import sparse, stats
 
-def compute_getis_ord(grid_gdf, value_col='total_abwaerme_mw', k=8):
-    # centroid-based spatial weights
-    centroids = grid_gdf.copy()
-    centroids['x'] = centroids.geometry.centroid.x
-    centroids['y'] = centroids.geometry.centroid.y
-    coords = list(zip(centroids.x, centroids.y))
-    w = libpysal.weights.KNN(coords, k=k)
-    # row-standardize
-    w.transform = 'r'
+from grid import grid_spec, grid_to_array, hotspot_kernel, neighbour_sum
+from weights import WEIGHTS_DIR, knn_weights
+
+# inference:
+#   'permutation' - bedingte Permutationen (z_sim/p_sim) wie esda.G_Local (n_jobs=-1 = alle Kerne),
+#                   mit seed reproduzierbar
+#   'parallel'    - gleicher Aufruf wie 'permutation' (seeded Lauf auf n_jobs Kernen), bleibt für
+#                   bestehende Aufrufer erhalten
+#   'analytic'    - geschlossene Normalapproximation (Zs/p_norm), keine Permutationen
+INFERENCE = ('permutation', 'parallel', 'analytic')
+
+def compute_getis_ord(grid_gdf, value_col='total_abwaerme_mw', k=8, inference='permutation',
+                      permutations=999, n_jobs=-1, seed=None, w=None, weights_dir=WEIGHTS_DIR):
+    if inference not in INFERENCE:
+        raise ValueError(f"inference must be one of {INFERENCE}")
+    # centroid-based KNN weights, row-standardized; gecacht je Grid/k (weights.knn_weights)
+    if w is None:
+        w = knn_weights(grid_gdf, k=k, transform='r', cache_dir=weights_dir)
     y = grid_gdf[value_col].values
-    g_local = G_Local(y, w, transform='r', star=False)
-    # g_local.z_sim is z-score, g_local.p_sim p-values
-    grid_gdf[f'{value_col}_GiZ'] = g_local.z_sim
-    grid_gdf[f'{value_col}_GIp'] = g_local.p_sim
+    if inference == 'analytic':
+        _, z, p = getis_ord_matrix(w.sparse, y[:, None], star=False)
+        z, p = z[:, 0], p[:, 0]
+    else:
+        g_local = G_Local(y, w, transform='r', star=False, permutations=permutations,
+                          n_jobs=n_jobs, seed=seed)
+        # g_local.z_sim is z-score, g_local.p_sim p-values
+        z, p = g_local.z_sim, g_local.p_sim
+    grid_gdf[f'{value_col}_GiZ'] = z
+    grid_gdf[f'{value_col}_GIp'] = p
+    return grid_gdf
+
+def getis_ord_matrix(w_sparse, values, star=False):
+    # Gi/Gi* für alle Spalten von values (n x m) auf einmal: ein Produkt W @ Y, Momente spaltenweise
+    # (gleiche Formeln wie esda.G_Local, analytische Inferenz, zeilenstandardisierte Gewichte)
+    y = np.asarray(values, dtype=float)
+    w = sparse.csr_matrix(w_sparse)
+    w.setdiag(0)
+    w.eliminate_zeros()
+    if star:
+        w = (w != 0).astype(float) + sparse.identity(w.shape[0], format='csr')
+    w = sparse.diags(1.0 / np.maximum(np.asarray(w.sum(axis=1)).ravel(), 1e-300)) @ w
+    remove_self = 0 if star else 1
+    n = w.shape[0] - remove_self
+    y_sum = y.sum(axis=0)
+    y2 = y * y
+    g = (w @ y) / (y_sum - y * remove_self)
+    mean = (y_sum - y * remove_self) / n
+    var = (y2.sum(axis=0) - y2 * remove_self) / n - mean ** 2
+    card = np.asarray(w.sum(axis=1))
+    expected = card / n
+    variance = card * (n - card) / (n - 1) / n ** 2 * var / mean ** 2
+    z = (g - expected) / np.sqrt(variance)
+    p = stats.norm.sf(np.abs(z))
+    return g, z, p
+
+def getis_ord_batch(grid_gdf, value_cols, k=8, star=False, w=None, weights_dir=WEIGHTS_DIR, values=None):
+    # viele Wertespalten (Wärme, Bedarf, Netto, Szenarien) in einem Durchgang;
+    # values: optional fertige n x m Matrix, dann benennt value_cols deren Spalten
+    if w is None:
+        w = knn_weights(grid_gdf, k=k, transform='r', cache_dir=weights_dir)
+    if values is None:
+        values = grid_gdf[list(value_cols)].to_numpy(dtype=float)
+    _, z, p = getis_ord_matrix(w.sparse, values, star=star)
+    cols = {}
+    for j, col in enumerate(value_cols):
+        cols[f'{col}_GiZ'] = z[:, j]
+        cols[f'{col}_GIp'] = p[:, j]
+    new = pd.DataFrame(cols, index=grid_gdf.index)
+    grid = pd.concat([grid_gdf.drop(columns=list(cols), errors='ignore'), new], axis=1)
+    grid.attrs = dict(grid_gdf.attrs)
+    return grid
+
+def getis_ord_star_array(values, mask, kernel):
+    # Gi* (Getis & Ord 1995, allgemeine Gewichte) für ein Raster; mask = gültige Zellen
+    x = np.where(mask, values, 0.0)
+    m = mask.astype(float)
+    n = m.sum()
+    mean = x.sum() / n
+    s = np.sqrt((x * x).sum() / n - mean ** 2)
+    lag = neighbour_sum(x, kernel)
+    w_sum = neighbour_sum(m, kernel)
+    w_sq = neighbour_sum(m, kernel * kernel)
+    denom = s * np.sqrt(np.maximum(n * w_sq - w_sum ** 2, 0) / (n - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (lag - mean * w_sum) / denom
+    z[~mask] = np.nan
+    return z
+
+def getis_ord_raster(grid_gdf, value_col='total_abwaerme_mw', kernel='queen', radius=None, sigma=None):
+    # Gi* auf dem regulären Grid per Faltung statt KNN-Baum (auch für Millionen Zellen)
+    spec = grid_spec(grid_gdf)
+    values, mask = grid_to_array(grid_gdf, value_col, fill=0.0)
+    mask &= ~np.isnan(values)
+    k = hotspot_kernel(kernel, spec['cell_size'], radius, sigma)
+    z = getis_ord_star_array(values, mask, k)
+    z = z[grid_gdf['ix'].values.astype(np.int64), grid_gdf['iy'].values.astype(np.int64)]
+    grid_gdf[f'{value_col}_GiZ'] = z
+    grid_gdf[f'{value_col}_GIp'] = stats.norm.sf(np.abs(z))
     return grid_gdf
 
 # Beispiel: grid = compute_getis_ord(grid, value_col='total_abwaerme_mw')
+#           grid = compute_getis_ord(grid, value_col='total_abwaerme_mw', inference='analytic')
+#           grid = compute_getis_ord(grid, value_col='total_abwaerme_mw', inference='parallel', seed=42)
+#           grid = getis_ord_batch(grid, ['total_abwaerme_mw', 'total_waermebedarf_mw', 'net_heat_mw'])
+#           grid = getis_ord_raster(grid, 'total_abwaerme_mw', kernel='gaussian', sigma=150)
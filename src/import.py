@@ -1,26 +1,77 @@
 # src/ingest.py
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
+import pyogrio
+import shapely
+from shapely.geometry import Point, box
 
-def load_bremen_boundary(path_to_shapefile):
-    gdf = gpd.read_file(path_to_shapefile).to_crs(epsg=3857)  # WebMercator für Meter
-    return gdf
+from cache import CACHE_DIR, cached_layer
+from crs import GEOGRAPHIC_CRS, WORKING_CRS, get_transformer, to_crs, transform_geometry
+
+# cache_dir=None schaltet den Layer-Cache ab
+# alle Layer werden in der metrischen Arbeits-CRS (crs.WORKING_CRS, UTM 32N) geliefert
+# bbox (minx, miny, maxx, maxy) und mask (Geometrie oder GeoDataFrame) in Arbeits-CRS,
+# columns = benötigte Attributspalten ([] = nur Geometrie)
+TARGET_CRS = WORKING_CRS
 
-def load_osm_buildings(shp_path):
-    buildings = gpd.read_file(shp_path).to_crs(epsg=3857)
-    return buildings
+def _mask_geometry(mask):
+    if isinstance(mask, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        return shapely.union_all(to_crs(mask, TARGET_CRS).geometry.values)
+    return mask
 
-def load_firm_excel(xlsx_path):
-    df = pd.read_excel(xlsx_path)
-    # Erwartete Spalten: name, lat, lon, abwaerme_mw, temperatur_c, waermebedarf_mw (optional)
-    df = df.dropna(subset=['lat','lon'])
-    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.lon, df.lat), crs="EPSG:4326").to_crs(epsg=3857)
+def _read_filtered(path, bbox=None, mask=None, columns=None):
+    # bbox/mask in die CRS der Quelldatei umrechnen und beim Lesen anwenden (OGR nutzt .shx/.qix);
+    # pyogrio nimmt nur eins von beiden -> mit mask lesen, bbox danach filtern
+    src_crs = pyogrio.read_info(path)['crs']
+    read_bbox = read_mask = None
+    if mask is not None:
+        read_mask = transform_geometry(mask, TARGET_CRS, src_crs)
+    elif bbox is not None:
+        read_bbox = get_transformer(TARGET_CRS, src_crs).transform_bounds(*bbox)
+    gdf = to_crs(gpd.read_file(path, bbox=read_bbox, mask=read_mask, columns=columns), TARGET_CRS)
+    if bbox is not None:
+        # umgerechnete bbox ist größer als die ursprüngliche (bzw. nicht gelesen) -> exakt nachfiltern
+        gdf = gdf[gdf.intersects(box(*bbox))]
     return gdf
 
+def _filter_key(bbox, mask, columns):
+    return {'crs': TARGET_CRS, 'bbox': None if bbox is None else tuple(map(float, bbox)),
+            'mask': None if mask is None else shapely.to_wkb(mask).hex(),
+            'columns': None if columns is None else sorted(columns)}
+
+def load_bremen_boundary(path_to_shapefile, cache_dir=CACHE_DIR):
+    def load():
+        return to_crs(gpd.read_file(path_to_shapefile), TARGET_CRS)
+    return cached_layer(path_to_shapefile, load, cache_dir=cache_dir, crs=TARGET_CRS)
+
+def load_osm_buildings(shp_path, bbox=None, mask=None, columns=None, cache_dir=CACHE_DIR):
+    # z.B. nur ein Stadtteil: load_osm_buildings(path, mask=stadtteil_gdf, columns=['type'])
+    mask = _mask_geometry(mask)
+    def load():
+        return _read_filtered(shp_path, bbox=bbox, mask=mask, columns=columns)
+    return cached_layer(shp_path, load, cache_dir=cache_dir, **_filter_key(bbox, mask, columns))
+
+def load_firm_excel(xlsx_path, bbox=None, mask=None, columns=None, cache_dir=CACHE_DIR):
+    mask = _mask_geometry(mask)
+    def load():
+        usecols = None if columns is None else list(dict.fromkeys(['lat', 'lon'] + list(columns)))
+        df = pd.read_excel(xlsx_path, usecols=usecols)
+        # Erwartete Spalten: name, lat, lon, abwaerme_mw, temperatur_c, waermebedarf_mw (optional)
+        df = df.dropna(subset=['lat','lon'])
+        # lon/lat direkt in die Arbeits-CRS umrechnen (kein Umweg über EPSG:4326-Geometrien)
+        x, y = get_transformer(GEOGRAPHIC_CRS, TARGET_CRS).transform(df.lon.values, df.lat.values)
+        gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(x, y), crs=TARGET_CRS)
+        # Excel kann nicht räumlich gefiltert gelesen werden -> direkt nach dem Laden filtern
+        if bbox is not None:
+            gdf = gdf[gdf.intersects(box(*bbox))]
+        if mask is not None:
+            gdf = gdf[gdf.intersects(mask)]
+        return gdf
+    return cached_layer(xlsx_path, load, cache_dir=cache_dir, **_filter_key(bbox, mask, columns))
+
 # Beispiel Verwendung
 if __name__ == "__main__":
     bremen = load_bremen_boundary("data/bremen_boundary.shp")
-    buildings = load_osm_buildings("data/bremen-buildings.shp")
+    buildings = load_osm_buildings("data/bremen-buildings.shp", mask=bremen, columns=['type'])
     firms = load_firm_excel("data/companies_heat.xlsx")
     print(bremen.total_bounds, len(buildings), len(firms))
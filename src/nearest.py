@@ -0,0 +1,109 @@
+# src/nearest.py
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+from grid import grid_spec, grid_to_array, hotspot_kernel, neighbour_sum
+
+# Abfragen "welche Abwärmequellen liegen nahe einer Bedarfszelle" auf einem KD-Baum in der
+# metrischen Arbeits-CRS. Speicher linear: nie eine volle Bedarf x Angebot Matrix, Radius-
+# Abfragen laufen in Blöcken von batch_size Punkten.
+BATCH_SIZE = 65536
+# Distanzabfall für die Erreichbarkeit, alle Längen in m (d, scale_m, radius_m):
+#   'exponential' - exp(-d / scale_m), bis 5 scale_m     'gaussian' - exp(-d^2 / 2 scale_m^2), bis 3 scale_m
+#   'cutoff'      - 1 bis d <= scale_m, danach 0
+DECAY = ('exponential', 'gaussian', 'cutoff')
+
+def decay_weights(distance_m, kernel='exponential', scale_m=1000.0):
+    d = np.asarray(distance_m, dtype=float)
+    if kernel == 'exponential':
+        return np.exp(-d / scale_m)
+    if kernel == 'gaussian':
+        return np.exp(-d ** 2 / (2 * scale_m ** 2))
+    if kernel == 'cutoff':
+        return (d <= scale_m).astype(float)
+    raise ValueError(f"kernel must be one of {DECAY}")
+
+def _decay_radius(kernel, scale_m, radius_m):
+    if radius_m is not None:
+        return radius_m
+    return {'exponential': 5, 'gaussian': 3, 'cutoff': 1}[kernel] * scale_m
+
+def efficiency_score(capacity, distance_km):
+    # Efficiency = Supply capacity / Distance (closer and more supply = better), Distanz 0 -> capacity
+    capacity = np.asarray(capacity, dtype=float)
+    distance_km = np.asarray(distance_km, dtype=float)
+    return np.where(distance_km > 0, capacity / np.where(distance_km > 0, distance_km, 1.0), capacity)
+
+class SupplyIndex:
+
+    def __init__(self, xy, capacity=None):
+        self.xy = np.asarray(xy, dtype=float)
+        self.capacity = np.ones(len(self.xy)) if capacity is None else np.asarray(capacity, dtype=float)
+        self.tree = cKDTree(self.xy)
+
+    @classmethod
+    def from_gdf(cls, gdf, capacity_col=None):
+        xy = shapely.get_coordinates(shapely.centroid(gdf.geometry.values))
+        return cls(xy, None if capacity_col is None else gdf[capacity_col].to_numpy(dtype=float))
+
+    def __len__(self):
+        return len(self.xy)
+
+    def nearest(self, xy, k=1, max_distance=np.inf):
+        # (dist, idx) je Punkt, Form (n,) bzw. (n, k); ohne Quelle in max_distance: dist=inf, idx=len(self)
+        return self.tree.query(np.asarray(xy, dtype=float), k=k, distance_upper_bound=max_distance)
+
+    def _pair_batches(self, xy, radius_m, batch_size):
+        for start in range(0, len(xy), batch_size):
+            pairs = cKDTree(xy[start:start + batch_size]).sparse_distance_matrix(self.tree, radius_m, output_type='ndarray')
+            yield pairs['i'] + start, pairs['j'], pairs['v']
+
+    def within(self, xy, radius_m, batch_size=BATCH_SIZE):
+        # alle Paare (Punkt, Quelle, Distanz in m) mit Distanz <= radius_m, als flache Arrays
+        parts = list(self._pair_batches(np.asarray(xy, dtype=float), radius_m, batch_size))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return tuple(np.concatenate(p) for p in zip(*parts))
+
+    def capacity_within(self, xy, radius_m, batch_size=BATCH_SIZE):
+        # Summe der Kapazität aller Quellen im Umkreis je Punkt
+        return self.accessibility(xy, 'cutoff', radius_m, batch_size=batch_size)
+
+    def accessibility(self, xy, kernel='exponential', scale_m=1000.0, radius_m=None, batch_size=BATCH_SIZE):
+        # Summe der Kapazität aller Quellen, gewichtet mit dem Distanzabfall (decay_weights);
+        # Paare nur blockweise im Speicher, Summe je Block per bincount
+        xy = np.asarray(xy, dtype=float)
+        total = np.zeros(len(xy))
+        capacity = np.nan_to_num(self.capacity)
+        for point, source, dist in self._pair_batches(xy, _decay_radius(kernel, scale_m, radius_m), batch_size):
+            total += np.bincount(point, weights=capacity[source] * decay_weights(dist, kernel, scale_m), minlength=len(xy))
+        return total
+
+    def efficiency(self, xy):
+        # nächste Quelle, Distanz in km und Effizienz-Score für alle Punkte in einem Ausdruck
+        dist, idx = self.nearest(xy)
+        distance_km = dist / 1000
+        return idx, distance_km, efficiency_score(self.capacity[idx], distance_km)
+
+def accessibility_raster(grid_gdf, supply_col, kernel='exponential', scale_m=1000.0, radius_m=None):
+    # schneller Weg, wenn das Angebot schon aufs Grid aggregiert ist (z.B. total_abwaerme_mw):
+    # Faltung des Angebotsrasters mit dem Abfall-Kernel, Abstände zwischen Zellmittelpunkten in m
+    # (Kernel-Stützstellen = Vielfache der Zellgröße, gleiche Einheit wie scale_m/radius_m)
+    if kernel not in DECAY:
+        raise ValueError(f"kernel must be one of {DECAY}")
+    spec = grid_spec(grid_gdf)
+    supply, _ = grid_to_array(grid_gdf, supply_col, fill=0.0)
+    radius_m = _decay_radius(kernel, scale_m, radius_m)
+    if kernel == 'cutoff':
+        weights = hotspot_kernel('distance', spec['cell_size'], radius=radius_m)
+    else:
+        weights = hotspot_kernel(kernel, spec['cell_size'], radius=radius_m, sigma=scale_m)
+    surface = neighbour_sum(np.nan_to_num(supply), weights)
+    return surface[grid_gdf['ix'].values.astype(np.int64), grid_gdf['iy'].values.astype(np.int64)]
+
+# Beispiel: supply = SupplyIndex.from_gdf(supply_in_bremen, 'Heat_kWh_Year')
+#           idx, dist_km, score = supply.efficiency(demand_xy)
+#           heat_2km = supply.capacity_within(demand_xy, 2000)
+#           access = supply.accessibility(demand_xy, 'exponential', scale_m=500)
+#           grid['heat_access'] = accessibility_raster(grid, 'total_abwaerme_mw', 'gaussian', scale_m=300)
@@ -0,0 +1,159 @@
+# src/network.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+from cache import cache_key
+from crs import WORKING_CRS, to_crs
+
+# Straßengraph aus dem geofabrik-Straßenlayer: einmal kompilieren, als CSR (.npz) ablegen.
+# Knoten = Stützpunkte der Linien (auf SNAP_M gerundet), Kanten = Segmente mit Länge in m,
+# ungerichtet (Leitungen ignorieren Einbahnstraßen); nur die größte Zusammenhangskomponente.
+ROADS_PATH = 'geofabrik bremen/gis_osm_roads_free_1.shp'
+NETWORK_DIR = 'data/cache/network'
+SNAP_M = 0.01
+CHUNK_SIZE = 16
+
+def _compile(lines):
+    coords, line = shapely.get_coordinates(lines, return_index=True)
+    xy, node = np.unique(np.round(coords / SNAP_M).astype(np.int64), axis=0, return_inverse=True)
+    node = node.ravel()
+    seg = np.flatnonzero(line[1:] == line[:-1])
+    a, b = node[seg], node[seg + 1]
+    length = np.hypot(*(coords[seg + 1] - coords[seg]).T)
+    keep = a != b
+    a, b, length = np.minimum(a, b)[keep], np.maximum(a, b)[keep], length[keep]
+    # Mehrfachkanten: kürzeste behalten
+    order = np.lexsort((length, b, a))
+    a, b, length = a[order], b[order], length[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b, length = a[first], b[first], length[first]
+    n = len(xy)
+    graph = sparse.csr_matrix((np.concatenate([length, length]), (np.concatenate([a, b]), np.concatenate([b, a]))),
+                              shape=(n, n))
+    _, comp = csgraph.connected_components(graph, directed=False)
+    main = np.flatnonzero(comp == np.bincount(comp).argmax())
+    return graph[main][:, main].tocsr(), xy[main] * SNAP_M
+
+def _dijkstra_chunk(graph, sources, row, targets, cutoff):
+    # Distanzen nur für die angefragten Paare (row = Position der Quelle in sources)
+    dist = csgraph.dijkstra(graph, directed=False, indices=sources, limit=cutoff)
+    return dist[row, targets]
+
+_worker_graph = None
+
+def _init_worker(data, indices, indptr, n):
+    global _worker_graph
+    _worker_graph = sparse.csr_matrix((data, indices, indptr), shape=(n, n))
+
+def _worker_chunk(args):
+    return _dijkstra_chunk(_worker_graph, *args)
+
+class RoadGraph:
+
+    def __init__(self, graph, xy):
+        self.graph = graph
+        self.xy = xy
+        self._tree = cKDTree(xy)
+        # Knotenpaar-Cache: (quelle * n + ziel) -> Distanz in m, plus genutzter cutoff je unerreichbarem Paar
+        self._pairs = {}
+        self._cutoff = {}
+
+    @classmethod
+    def from_lines(cls, lines_gdf):
+        graph, xy = _compile(to_crs(lines_gdf, WORKING_CRS).geometry.values)
+        return cls(graph, xy)
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, data=self.graph.data, indices=self.graph.indices, indptr=self.graph.indptr, xy=self.xy)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            n = len(f['xy'])
+            return cls(sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=(n, n)), f['xy'])
+
+    def snap(self, xy):
+        # nächster Netzknoten je Punkt + Anbindungslänge (Luftlinie zum Knoten)
+        d, node = self._tree.query(np.asarray(xy, dtype=float))
+        return node, d
+
+    def _route(self, pair_src, pair_dst, cutoff, n_jobs):
+        # Dijkstra je Quellknoten (begrenzt durch cutoff), Chunks parallel auf n_jobs Prozessen;
+        # pair_src aufsteigend sortiert, jeder Chunk liefert nur seine angefragten Paare
+        sources, row = np.unique(pair_src, return_inverse=True)
+        bounds = np.searchsorted(row, np.r_[np.arange(0, len(sources), CHUNK_SIZE), len(sources)])
+        chunks = [(sources[c:c + CHUNK_SIZE], row[lo:hi] - c, pair_dst[lo:hi], cutoff)
+                  for c, lo, hi in zip(range(0, len(sources), CHUNK_SIZE), bounds[:-1], bounds[1:])]
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        if n_jobs <= 1 or len(chunks) <= 1:
+            parts = [_dijkstra_chunk(self.graph, *c) for c in chunks]
+        else:
+            g = self.graph
+            with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                     initargs=(g.data, g.indices, g.indptr, g.shape[0])) as ex:
+                parts = list(ex.map(_worker_chunk, chunks))
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def node_distances(self, src_nodes, dst_nodes, cutoff=np.inf, n_jobs=-1):
+        # Netzdistanz (m) je Knotenpaar, np.inf wenn nicht innerhalb cutoff erreichbar;
+        # geroutet und gecacht werden nur die angefragten Paare
+        n = len(self.xy)
+        src_nodes = np.asarray(src_nodes, dtype=np.int64)
+        dst_nodes = np.asarray(dst_nodes, dtype=np.int64)
+        keys = (src_nodes * n + dst_nodes).tolist()
+        cached = [self._pairs.get(k) for k in keys]
+        missing = np.array([d is None or (d == np.inf and self._cutoff.get(k, -1) < cutoff)
+                            for d, k in zip(cached, keys)], dtype=bool)
+        if missing.any():
+            todo = np.unique(np.asarray(keys, dtype=np.int64)[missing])
+            dist = self._route(todo // n, todo % n, cutoff, n_jobs)
+            todo = todo.tolist()
+            self._pairs.update(zip(todo, dist.tolist()))
+            # unerreichbare Paare merken sich den cutoff, bis zu dem gesucht wurde
+            for k, d in zip(todo, dist.tolist()):
+                if d == np.inf:
+                    self._cutoff[k] = max(self._cutoff.get(k, -1), cutoff)
+            cached = [self._pairs[k] for k in keys]
+        return np.array(cached, dtype=float)
+
+    def pair_distances(self, src_xy, dst_xy, pair_src, pair_dst, cutoff=np.inf, n_jobs=-1):
+        # Straßendistanz (m) für Punktpaare inkl. Anbindung beider Punkte ans Netz
+        src_node, src_snap = self.snap(src_xy)
+        dst_node, dst_snap = self.snap(dst_xy)
+        network = self.node_distances(src_node[pair_src], dst_node[pair_dst], cutoff, n_jobs)
+        return src_snap[pair_src] + network + dst_snap[pair_dst]
+
+    def distance_matrix(self, src_xy, dst_xy, cutoff=np.inf, n_jobs=-1):
+        # dichte n x m Matrix (nur für überschaubare Punktmengen)
+        i, j = np.divmod(np.arange(len(src_xy) * len(dst_xy)), len(dst_xy))
+        return self.pair_distances(src_xy, dst_xy, i, j, cutoff, n_jobs).reshape(len(src_xy), len(dst_xy))
+
+def road_graph(path=ROADS_PATH, mask=None, cache_dir=NETWORK_DIR):
+    # kompilierter Graph, gecacht je Quelldatei-Hash (+ mask); mask in Arbeits-CRS
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        params = {'crs': WORKING_CRS, 'mask': None if mask is None else shapely.to_wkb(mask).hex()}
+        cache_path = os.path.join(cache_dir, f'roads-{cache_key(path, cache_dir, **params)}.npz')
+        if os.path.exists(cache_path):
+            return RoadGraph.load(cache_path)
+    lines = to_crs(gpd.read_file(path, columns=[]), WORKING_CRS)
+    if mask is not None:
+        lines = lines[lines.intersects(mask)]
+    graph = RoadGraph.from_lines(lines)
+    if cache_dir is not None:
+        graph.save(cache_path)
+    return graph
+
+# Beispiel: roads = road_graph()
+#           d = roads.distance_matrix(firm_xy, district_xy, cutoff=5000)
+#           optimize_allocation(firms, districts, max_distance_m=5000, road_graph=roads)
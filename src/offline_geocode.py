@@ -0,0 +1,245 @@
+# src/offline_geocode.py
+import difflib
+import os
+import re
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from cache import CACHE_DIR, cache_key, cached_layer
+from crs import GEOGRAPHIC_CRS, WORKING_CRS, to_crs
+from geocache import normalize_address
+
+# Offline-Geocoder aus den lokalen geofabrik-Extrakten, ohne Netz und ohne Zufall:
+#   Orte     - places (Punkte) + places_a (Stadtflächen): Name -> Mittelpunkt
+#   Straßen  - roads: Name je Gemeinde -> Stützpunkt nahe der Straßenmitte (unscharfer Abgleich)
+#   Landmarken - benannte POIs/Gebäude, falls die "Straße" eigentlich ein Objektname ist
+#   PLZ      - optionale Tabelle (plz, lat, lon); die geofabrik-free-Daten enthalten keine Postleitzahlen
+# Jede Zeile bekommt match_level (street > landmark > postcode > locality > none) und match_score.
+PLACES_PATH = 'geofabrik bremen/gis_osm_places_free_1.shp'
+PLACES_A_PATH = 'geofabrik bremen/gis_osm_places_a_free_1.shp'
+ROADS_PATH = 'geofabrik bremen/gis_osm_roads_free_1.shp'
+LANDMARK_PATHS = ('geofabrik bremen/gis_osm_pois_free_1.shp', 'geofabrik bremen/gis_osm_pois_a_free_1.shp',
+                  'geofabrik bremen/gis_osm_buildings_a_free_1.shp')
+MUNICIPALITY_CLASSES = ('city', 'town', 'village')
+MATCH_LEVELS = ('street', 'landmark', 'postcode', 'locality', 'none')
+STREET_CUTOFF = 0.85
+
+# nach normalize_address sind '-', '/' und ',' schon Leerzeichen: '12-14a' -> '12 14a', '5/7' -> '5 7'
+_HOUSENUMBER = re.compile(r'(\s*\b\d+\s*[a-z]?)+\s*$')
+
+def normalize_street(street):
+    # 'Am Wall 12-14a' -> 'am wall', 'Hauptstr. 5/7' -> 'hauptstr', 'Hafenstraße 3' -> 'hafenstr'
+    return _HOUSENUMBER.sub('', normalize_address(street)).strip()
+
+def normalize_postcode(postcode):
+    digits = re.sub(r'\D', '', str(postcode).split('.')[0])
+    return digits.zfill(5) if digits else ''
+
+def _locality_keys(locality):
+    # 'Bremen-Vegesack' -> ['bremen vegesack', 'vegesack', 'bremen'] (spezifisch vor allgemein)
+    name = normalize_address(locality)
+    parts = name.split()
+    return list(dict.fromkeys([name] + parts[1:] + parts[:1])) if parts else []
+
+def _read(path, columns):
+    if path is None or not os.path.exists(path):
+        return None
+    return to_crs(gpd.read_file(path, columns=columns), WORKING_CRS)
+
+def _representative(keys, geoms):
+    # je Schlüssel der Stützpunkt, der dem Mittel aller Stützpunkte am nächsten liegt (liegt auf der Straße)
+    coords, part = shapely.get_coordinates(geoms, return_index=True)
+    group = keys[part]
+    n = group.max() + 1
+    mean = np.column_stack([np.bincount(group, coords[:, i], n) / np.bincount(group, minlength=n) for i in (0, 1)])
+    dist = np.hypot(*(coords - mean[group]).T)
+    order = np.lexsort((dist, group))
+    first = order[np.r_[True, group[order][1:] != group[order][:-1]]]
+    return coords[first]
+
+def _to_lonlat(xy):
+    pts = gpd.GeoSeries(gpd.points_from_xy(xy[:, 0], xy[:, 1]), crs=WORKING_CRS).to_crs(GEOGRAPHIC_CRS)
+    return pts.y.to_numpy(), pts.x.to_numpy()
+
+def _point_table(names, xy, **extra):
+    lat, lon = _to_lonlat(xy) if len(xy) else (np.empty(0), np.empty(0))
+    return pd.DataFrame({'key': names, 'lat': lat, 'lon': lon, **extra})
+
+def build_localities(places_path=PLACES_PATH, places_a_path=PLACES_A_PATH, extra=None):
+    # key -> (lat, lon); Flächen vor Punkten, bei Namensgleichheit die höhere Einwohnerzahl.
+    # extra: {'Hamburg': (lat, lon), ...} für Orte außerhalb des Extrakts (niedrigste Priorität)
+    tables = []
+    for path in (places_a_path, places_path):
+        gdf = _read(path, ['fclass', 'name', 'population'])
+        if gdf is None:
+            continue
+        gdf = gdf[gdf['name'].notna()]
+        xy = shapely.get_coordinates(shapely.point_on_surface(gdf.geometry.values))
+        tables.append(_point_table(gdf['name'].map(normalize_address).to_numpy(), xy,
+                                   population=gdf['population'].fillna(0).to_numpy()))
+    if extra:
+        tables.append(pd.DataFrame({'key': [normalize_address(k) for k in extra],
+                                    'lat': [v[0] for v in extra.values()], 'lon': [v[1] for v in extra.values()],
+                                    'population': -1}))
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['key', 'lat', 'lon', 'population'])
+    # stabile Sortierung: Reihenfolge der Quellen (Fläche, Punkt, extra) bei gleicher Einwohnerzahl
+    table = table.iloc[np.lexsort((np.arange(len(table)), -table['population'].to_numpy(dtype=float)))]
+    return table.drop_duplicates('key').set_index('key')[['lat', 'lon']]
+
+def _municipalities(places_path, places_a_path):
+    # Gemeindeflächen (places_a) bzw. -punkte (places) zum Zuordnen von Straßen
+    areas = _read(places_a_path, ['fclass', 'name'])
+    points = _read(places_path, ['fclass', 'name'])
+    if areas is not None:
+        areas = areas[areas['fclass'].isin(MUNICIPALITY_CLASSES) & areas['name'].notna()]
+    if points is not None:
+        points = points[points['fclass'].isin(MUNICIPALITY_CLASSES) & points['name'].notna()]
+    return areas, points
+
+def _assign_municipality(xy, areas, points):
+    names = np.full(len(xy), '', dtype=object)
+    if points is not None and len(points):
+        _, idx = cKDTree(shapely.get_coordinates(points.geometry.values)).query(xy)
+        names[:] = points['name'].map(normalize_address).to_numpy()[idx]
+    if areas is not None and len(areas):
+        hit_pt, hit_area = shapely.STRtree(areas.geometry.values).query(shapely.points(xy), predicate='within')
+        names[hit_pt] = areas['name'].map(normalize_address).to_numpy()[hit_area]
+    return names
+
+def build_named_points(paths, places_path=PLACES_PATH, places_a_path=PLACES_A_PATH):
+    # (municipality, name) -> Punkt; Linien/Flächen gleichen Namens je Gemeinde zusammengefasst
+    frames = [g[g['name'].notna()] for g in (_read(p, ['name']) for p in paths) if g is not None]
+    if not frames:
+        return pd.DataFrame(columns=['locality', 'key', 'lat', 'lon'])
+    gdf = pd.concat(frames, ignore_index=True)
+    areas, points = _municipalities(places_path, places_a_path)
+    centre = shapely.get_coordinates(shapely.point_on_surface(gdf.geometry.values))
+    town = _assign_municipality(centre, areas, points)
+    name = gdf['name'].map(normalize_street).to_numpy()
+    pairs = pd.MultiIndex.from_arrays([town, name])
+    codes, uniques = pd.factorize(pairs)
+    xy = _representative(codes, gdf.geometry.values)
+    return _point_table(uniques.get_level_values(1).to_numpy(), xy, locality=uniques.get_level_values(0).to_numpy())
+
+def _cached_points(paths, build, cache_dir, places_paths):
+    # Index als kleiner Punkt-Layer über den Layer-Cache; Schlüssel = Hash aller Quelldateien
+    paths = [p for p in paths if p is not None and os.path.exists(p)]
+    if not paths:
+        return build([])
+    if cache_dir is None:
+        return build(paths)
+    sources = {f'source{i}': cache_key(p, cache_dir) for i, p in enumerate(paths[1:] + list(places_paths))
+               if p is not None and os.path.exists(p)}
+    def load():
+        table = build(paths)
+        return gpd.GeoDataFrame(table, geometry=gpd.points_from_xy(table['lon'], table['lat']), crs=GEOGRAPHIC_CRS)
+    return pd.DataFrame(cached_layer(paths[0], load, cache_dir=cache_dir, index='names', **sources).drop(columns='geometry'))
+
+def load_postcodes(postcodes):
+    # DataFrame oder CSV mit Spalten plz, lat, lon (z.B. PLZ-Schwerpunkte aus einer externen Quelle)
+    if postcodes is None:
+        return pd.DataFrame(columns=['lat', 'lon'], index=pd.Index([], name='plz'))
+    table = pd.read_csv(postcodes, dtype={'plz': str}) if isinstance(postcodes, str) else postcodes.copy()
+    table['plz'] = table['plz'].map(normalize_postcode)
+    return table.drop_duplicates('plz').set_index('plz')[['lat', 'lon']]
+
+class OfflineGeocoder:
+
+    def __init__(self, localities, streets, landmarks=None, postcodes=None):
+        # localities: index key -> lat, lon; streets/landmarks: locality, key, lat, lon
+        self.localities = localities
+        self.postcodes = load_postcodes(postcodes)
+        empty = pd.DataFrame(columns=['locality', 'key', 'lat', 'lon'])
+        self.names = {'street': empty if streets is None else streets[['locality', 'key', 'lat', 'lon']],
+                      'landmark': empty if landmarks is None else landmarks[['locality', 'key', 'lat', 'lon']]}
+
+    @classmethod
+    def from_osm(cls, places_path=PLACES_PATH, places_a_path=PLACES_A_PATH, roads_path=ROADS_PATH,
+                 landmark_paths=LANDMARK_PATHS, postcodes=None, extra_localities=None, cache_dir=CACHE_DIR):
+        localities = build_localities(places_path, places_a_path, extra_localities)
+        build = lambda paths: build_named_points(paths, places_path, places_a_path)
+        streets = _cached_points([roads_path], build, cache_dir, (places_path, places_a_path))
+        landmarks = _cached_points(list(landmark_paths), build, cache_dir, (places_path, places_a_path))
+        return cls(localities, streets, landmarks, postcodes)
+
+    def _towns(self, localities):
+        # Ortsangabe -> bekannter Ortsschlüssel (spezifischster Treffer aus _locality_keys), sonst NaN
+        keys = localities.map(_locality_keys).explode().dropna()
+        keys = pd.DataFrame({'row': keys.index, 'town': keys.to_numpy(), 'rank': keys.groupby(level=0).cumcount()})
+        keys = keys[keys['town'].isin(self.localities.index)].sort_values(['row', 'rank']).drop_duplicates('row')
+        return pd.Series(keys['town'].to_numpy(), index=keys['row'].to_numpy()).reindex(localities.index)
+
+    @staticmethod
+    def _fuzzy(misses, table, cutoff):
+        # unscharfer Abgleich nur für die Fehlschläge, in Blöcken (Gemeinde, Anfangsbuchstabe):
+        # jeder Straßenname einmal gegen die Namen seines Blocks (Tippfehler im ersten Buchstaben
+        # werden nicht gefunden)
+        found = []
+        misses = misses[['town', 'street']].drop_duplicates()
+        blocks = misses.groupby([misses['town'], misses['street'].str[0]])['street']
+        names = table.groupby([table['locality'], table['key'].str[0]])['key']
+        for block, streets in blocks:
+            if block not in names.groups:
+                continue
+            candidates = names.get_group(block).tolist()
+            for street in streets.tolist():
+                close = difflib.get_close_matches(street, candidates, n=1, cutoff=cutoff)
+                if close:
+                    found.append((block[0], street, close[0], difflib.SequenceMatcher(None, street, close[0]).ratio()))
+        return pd.DataFrame(found, columns=['town', 'street', 'key', 'match_score'])
+
+    def _match_names(self, todo, table, cutoff):
+        # todo: town, street -> lat, lon, match_score, matched_name (exakt per merge, Rest unscharf)
+        exact = todo.merge(table, left_on=['town', 'street'], right_on=['locality', 'key'], how='inner')
+        exact['match_score'] = 1.0
+        misses = todo[~todo.set_index(['town', 'street']).index.isin(exact.set_index(['town', 'street']).index)]
+        fuzzy = self._fuzzy(misses, table, cutoff).merge(table, left_on=['town', 'key'], right_on=['locality', 'key'])
+        fuzzy = misses.merge(fuzzy, on=['town', 'street'])
+        hits = pd.concat([exact, fuzzy], ignore_index=True)
+        return hits.rename(columns={'key': 'matched_name'})[['row', 'lat', 'lon', 'match_score', 'matched_name']]
+
+    def geocode(self, streets, postcodes, localities, cutoff=STREET_CUTOFF):
+        # drei gleich lange Spalten (Straße + Hausnummer, PLZ, Ort) -> DataFrame mit
+        # Latitude, Longitude, match_level, match_score, matched_name (Index wie die Eingabe);
+        # ein Batch über die eindeutigen (Straße, PLZ, Ort), Stufen als Tabellen-Merges
+        index = getattr(streets, 'index', None)
+        frame = pd.DataFrame({'street': pd.Series(list(streets)).map(normalize_street),
+                              'plz': pd.Series(list(postcodes)).map(normalize_postcode),
+                              'locality': pd.Series(list(localities)).astype(str)})
+        unique = frame.drop_duplicates().reset_index(drop=True)
+        unique['town'] = self._towns(unique['locality'])
+        unique['row'] = np.arange(len(unique))
+        result = pd.DataFrame({'Latitude': np.nan, 'Longitude': np.nan, 'match_level': 'none',
+                               'match_score': 0.0, 'matched_name': None}, index=unique.index)
+        open_rows = pd.Series(True, index=unique.index)
+
+        def assign(hits, level):
+            rows = hits['row'].to_numpy()
+            result.loc[rows, ['Latitude', 'Longitude']] = hits[['lat', 'lon']].to_numpy(dtype=float)
+            result.loc[rows, 'match_level'] = level
+            result.loc[rows, 'match_score'] = hits['match_score'].to_numpy(dtype=float)
+            result.loc[rows, 'matched_name'] = hits['matched_name'].to_numpy()
+            open_rows[rows] = False
+
+        for level in ('street', 'landmark'):
+            todo = unique.loc[open_rows & unique['town'].notna() & (unique['street'] != ''), ['row', 'town', 'street']]
+            assign(self._match_names(todo, self.names[level], cutoff), level)
+        for level, key, table in (('postcode', 'plz', self.postcodes), ('locality', 'town', self.localities)):
+            hits = unique.loc[open_rows, ['row', key]].merge(table, left_on=key, right_index=True)
+            assign(hits.assign(match_score=1.0, matched_name=hits[key]), level)
+
+        resolved = pd.concat([unique[['street', 'plz', 'locality']], result], axis=1)
+        out = frame.merge(resolved, on=['street', 'plz', 'locality'], how='left')
+        out = out[['Latitude', 'Longitude', 'match_level', 'match_score', 'matched_name']]
+        if index is not None:
+            out.index = index
+        return out
+
+# Beispiel:
+# geocoder = OfflineGeocoder.from_osm(postcodes='data/geocoding/plz_centroids.csv')
+# coords = geocoder.geocode(df['Straße und Hausnummer'], df['PLZ'], df['Ort'])
+# df = df.join(coords)
@@ -1,36 +1,301 @@
 # src/optimization.py
+import time
+
+import highspy
+import networkx as nx
 import pulp
 import numpy as np
+import shapely
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.spatial import cKDTree
 
-def optimize_allocation(sources, sinks):
-    # sources: GeoDataFrame with columns ['id','supply_mw','geometry']
-    # sinks: GeoDataFrame with columns ['id','demand_mw','geometry']
-    # Build cost matrix = distance (m) converted to cost €/MW
-    src_ids = sources['id'].tolist()
-    sink_ids = sinks['id'].tolist()
-    dist = {}
-    for i, s in sources.iterrows():
-        for j, t in sinks.iterrows():
-            d = s.geometry.centroid.distance(t.geometry.centroid)
-            dist[(s.id, t.id)] = d/1000.0  # km as proxy
-    # Problem
+# solver:
+#   'pulp'    - PuLP-Modell, CBC (bisheriges Verhalten)
+#   'highs'   - dünnbesetzte Matrix direkt an HiGHS (scipy.optimize.linprog), ohne LP-Datei
+#   'network' - Min-Cost-Flow per Netzwerk-Simplex (networkx); Flüsse in kW, Kosten in m ganzzahlig
+SOLVERS = ('pulp', 'highs', 'network')
+FLOW_SCALE = 1000     # MW -> kW
+COST_SCALE = 1000     # km -> m
+
+def candidate_arcs(src_xy, sink_xy, max_distance_m=None, k_nearest=None):
+    # mögliche Leitungen (Quelle i -> Senke j) als Index-Arrays + Länge in km
+    #   max_distance_m - nur Paare bis zu dieser Leitungslänge
+    #   k_nearest      - je Quelle nur die k nächsten Senken (ggf. zusätzlich <= max_distance_m)
+    #   beides None    - alle n x m Paare (bisheriges Verhalten)
+    n, m = len(src_xy), len(sink_xy)
+    if k_nearest is not None:
+        k = min(int(k_nearest), m)
+        bound = np.inf if max_distance_m is None else max_distance_m
+        d, j = cKDTree(sink_xy).query(src_xy, k=k, distance_upper_bound=bound)
+        d, j = d.reshape(n, k), j.reshape(n, k)
+        keep = j < m
+        i = np.broadcast_to(np.arange(n)[:, None], (n, k))[keep]
+        j, d = j[keep], d[keep]
+    elif max_distance_m is not None:
+        pairs = cKDTree(src_xy).sparse_distance_matrix(cKDTree(sink_xy), max_distance_m, output_type='ndarray')
+        i, j, d = pairs['i'], pairs['j'], pairs['v']
+    else:
+        i, j = np.divmod(np.arange(n * m), m)
+        d = np.hypot(*(src_xy[i] - sink_xy[j]).T)
+    return i.astype(np.int64), j.astype(np.int64), d / 1000.0  # km as proxy
+
+def _arcs(src_xy, sink_xy, max_distance_m, k_nearest, road_graph):
+    arc_src, arc_sink, cost = candidate_arcs(src_xy, sink_xy, max_distance_m, k_nearest)
+    if road_graph is not None:
+        cutoff = np.inf if max_distance_m is None else max_distance_m
+        cost = road_graph.pair_distances(src_xy, sink_xy, arc_src, arc_sink, cutoff=cutoff) / 1000.0
+        ok = cost <= cutoff / 1000.0
+        arc_src, arc_sink, cost = arc_src[ok], arc_sink[ok], cost[ok]
+    return arc_src, arc_sink, cost
+
+def _grouped(index, values, size):
+    # values nach index gruppiert (eine Liste je 0..size-1), linear in der Arc-Zahl
+    order = np.argsort(index, kind='stable')
+    bounds = np.searchsorted(index[order], np.arange(size + 1))
+    values = [values[o] for o in order]
+    return [values[bounds[g]:bounds[g + 1]] for g in range(size)]
+
+def _solve_pulp(cost, arc_src, arc_sink, supply, demand, timings):
+    t0 = time.perf_counter()
     prob = pulp.LpProblem("heat_alloc", pulp.LpMinimize)
-    # Variables flow[(i,j)]
-    flow = pulp.LpVariable.dicts("flow", (src_ids, sink_ids), lowBound=0, cat='Continuous')
+    # one variable per candidate arc
+    flow = [pulp.LpVariable(f'flow_{a}', lowBound=0, cat='Continuous') for a in range(len(cost))]
     # Objective
-    prob += pulp.lpSum([flow[i][j] * dist[(i,j)] for i in src_ids for j in sink_ids])
-    # supply constraints
-    for i in src_ids:
-        prob += pulp.lpSum([flow[i][j] for j in sink_ids]) <= float(sources.loc[sources.id==i,'supply_mw'])
-    # demand constraints
-    for j in sink_ids:
-        prob += pulp.lpSum([flow[i][j] for i in src_ids]) >= float(sinks.loc[sinks.id==j,'demand_mw'])
+    prob += pulp.LpAffineExpression(zip(flow, cost.tolist()))
+    # supply / demand constraints, aus den Index-Arrays gruppiert statt per .loc je Constraint
+    for i, arcs in enumerate(_grouped(arc_src, flow, len(supply))):
+        prob += pulp.LpAffineExpression((v, 1.0) for v in arcs) <= supply[i]
+    for j, arcs in enumerate(_grouped(arc_sink, flow, len(demand))):
+        prob += pulp.LpAffineExpression((v, 1.0) for v in arcs) >= demand[j]
+    t1 = time.perf_counter()
     prob.solve()
+    timings.update(build_s=t1 - t0, solve_s=time.perf_counter() - t1)
+    if prob.status != pulp.LpStatusOptimal:
+        raise ValueError(f"allocation LP not solved: {pulp.LpStatus[prob.status]}")
+    return np.array([v.varValue or 0.0 for v in flow])
+
+def _solve_highs(cost, arc_src, arc_sink, supply, demand, timings):
+    # A_ub x <= b_ub: Zeilen 0..n-1 Angebot, n..n+m-1 Bedarf (mit -1 als >=)
+    t0 = time.perf_counter()
+    n_arcs = len(cost)
+    arcs = np.arange(n_arcs)
+    a_ub = sparse.csr_matrix((np.concatenate([np.ones(n_arcs), -np.ones(n_arcs)]),
+                              (np.concatenate([arc_src, len(supply) + arc_sink]), np.concatenate([arcs, arcs]))),
+                             shape=(len(supply) + len(demand), n_arcs))
+    b_ub = np.concatenate([supply, -demand])
+    t1 = time.perf_counter()
+    res = linprog(cost, A_ub=a_ub, b_ub=b_ub, bounds=(0, None), method='highs')
+    timings.update(build_s=t1 - t0, solve_s=time.perf_counter() - t1)
+    if res.status != 0:
+        raise ValueError(f"allocation LP not solved: {res.message}")
+    return res.x
+
+def _solve_network(cost, arc_src, arc_sink, supply, demand, timings):
+    # ganzzahliger Min-Cost-Flow; überschüssiges Angebot fließt kostenlos in eine Supersenke
+    t0 = time.perf_counter()
+    supply_int = np.round(supply * FLOW_SCALE).astype(np.int64)
+    demand_int = np.round(demand * FLOW_SCALE).astype(np.int64)
+    excess = int(supply_int.sum() - demand_int.sum())
+    if excess < 0:
+        raise ValueError("total supply is smaller than total demand")
+    g = nx.DiGraph()
+    g.add_nodes_from((('s', i), {'demand': -int(v)}) for i, v in enumerate(supply_int))
+    g.add_nodes_from((('t', j), {'demand': int(v)}) for j, v in enumerate(demand_int))
+    g.add_node('excess', demand=excess)
+    weights = np.round(cost * COST_SCALE).astype(np.int64)
+    g.add_edges_from((('s', i), ('t', j), {'weight': w})
+                     for i, j, w in zip(arc_src.tolist(), arc_sink.tolist(), weights.tolist()))
+    g.add_edges_from((('s', i), 'excess', {'weight': 0}) for i in range(len(supply)))
+    t1 = time.perf_counter()
+    try:
+        _, flow_dict = nx.network_simplex(g)
+    except nx.NetworkXUnfeasible as e:
+        raise ValueError(f"allocation LP not solved: {e}") from e
+    timings.update(build_s=t1 - t0, solve_s=time.perf_counter() - t1)
+    flows = np.array([flow_dict[('s', i)][('t', j)] for i, j in zip(arc_src.tolist(), arc_sink.tolist())], dtype=float)
+    return flows / FLOW_SCALE
+
+_SOLVE = {'pulp': _solve_pulp, 'highs': _solve_highs, 'network': _solve_network}
+
+def optimize_allocation(sources, sinks, max_distance_m=None, k_nearest=None, solver='pulp', timings=None,
+                        road_graph=None):
+    # sources: GeoDataFrame with columns ['id','supply_mw','geometry']
+    # sinks: GeoDataFrame with columns ['id','demand_mw','geometry']
+    # Cost = distance (km) per MW, only for candidate arcs (candidate_arcs);
+    # zu starkes Beschneiden kann das Modell unlösbar machen (Senke ohne erreichbare Quelle) -> ValueError
+    # timings: optionales dict, erhält arcs_s / build_s / solve_s
+    # road_graph: network.RoadGraph -> Kosten = Straßendistanz statt Luftlinie (Luftlinie filtert vor,
+    # Arcs über max_distance_m Straßenlänge oder ohne Verbindung fallen weg)
+    if solver not in SOLVERS:
+        raise ValueError(f"solver must be one of {SOLVERS}")
+    timings = {} if timings is None else timings
+    src_ids = sources['id'].to_numpy()
+    sink_ids = sinks['id'].to_numpy()
+    supply = sources['supply_mw'].to_numpy(dtype=float)
+    demand = sinks['demand_mw'].to_numpy(dtype=float)
+    t0 = time.perf_counter()
+    src_xy = shapely.get_coordinates(shapely.centroid(sources.geometry.values))
+    sink_xy = shapely.get_coordinates(shapely.centroid(sinks.geometry.values))
+    arc_src, arc_sink, cost = _arcs(src_xy, sink_xy, max_distance_m, k_nearest, road_graph)
+    timings['arcs_s'] = time.perf_counter() - t0
+    if len(cost) == 0:
+        if demand.sum() > 0:
+            raise ValueError("no feasible arcs: every source/sink pair was pruned (max_distance_m/k_nearest)")
+        return []
+    values = _SOLVE[solver](cost, arc_src, arc_sink, supply, demand, timings)
     # Collect results
-    results = []
-    for i in src_ids:
-        for j in sink_ids:
-            val = pulp.value(flow[i][j])
-            if val and val>0:
-                results.append({'source':i,'sink':j,'flow_mw':val})
-    return results
+    used = np.flatnonzero(values > 1e-9)
+    return [{'source': src_ids[arc_src[a]], 'sink': sink_ids[arc_sink[a]], 'flow_mw': values[a]} for a in used]
+
+class AllocationModel:
+    # persistentes HiGHS-Modell für wiederholte Allokationen: Änderungen (Kapazität, Bedarf,
+    # Kosten, neue/entfernte Quellen und Senken) werden als Delta eingespielt und vom letzten
+    # Basis-Stand aus nachgelöst statt das LP neu aufzubauen.
+    # Zeilen: eine je Quelle (Angebot <= supply_mw) bzw. Senke (Zufluss >= demand_mw),
+    # Spalten: eine je Kandidaten-Arc (wie optimize_allocation, gleiche Pruning-Parameter).
+    # Entfernen = Kapazität/Bedarf auf 0 setzen, Zeilen und Spalten bleiben (Basis bleibt gültig).
+    # Mit k_nearest hängen die Arcs einer Quelle von allen aktiven Senken ab: neue oder entfernte
+    # Senken gleichen die Arc-Mengen der Quellen an den Kaltstart an (Spalten ab-/zuschalten).
+
+    def __init__(self, sources, sinks, max_distance_m=None, k_nearest=None, road_graph=None):
+        self.max_distance_m = max_distance_m
+        self.k_nearest = k_nearest
+        self.road_graph = road_graph
+        self.h = highspy.Highs()
+        self.h.setOptionValue('output_flag', False)
+        self._rows = {'source': {}, 'sink': {}}
+        self._xy = {'source': np.empty((0, 2)), 'sink': np.empty((0, 2))}
+        self._ids = {'source': [], 'sink': []}
+        self._active = {'source': np.empty(0, dtype=bool), 'sink': np.empty(0, dtype=bool)}
+        self._arc_src = np.empty(0, dtype=np.int64)
+        self._arc_sink = np.empty(0, dtype=np.int64)
+        self._cols = {}
+        self._enabled = np.empty(0, dtype=bool)
+        self._add('source', sources['id'].tolist(), sources['supply_mw'].to_numpy(dtype=float),
+                  shapely.get_coordinates(shapely.centroid(sources.geometry.values)), link=False)
+        self._add('sink', sinks['id'].tolist(), sinks['demand_mw'].to_numpy(dtype=float),
+                  shapely.get_coordinates(shapely.centroid(sinks.geometry.values)), link=False)
+        self._add_arcs(*_arcs(self._xy['source'], self._xy['sink'], max_distance_m, k_nearest, road_graph))
+
+    def _bounds(self, kind, value):
+        return (-highspy.kHighsInf, value) if kind == 'source' else (value, highspy.kHighsInf)
+
+    def _add(self, kind, ids, values, xy, link=True):
+        # erst alle ids prüfen, dann das Modell ändern (kein halb eingetragener Block)
+        known = [i for i in ids if i in self._rows[kind]]
+        if known:
+            raise ValueError(f"{kind} {known[0]!r} already in model")
+        if len(set(ids)) != len(ids):
+            dup = next(i for i in ids if ids.count(i) > 1)
+            raise ValueError(f"{kind} {dup!r} given more than once")
+        first = self.h.getNumRow()
+        for k, i in enumerate(ids):
+            self._rows[kind][i] = (len(self._ids[kind]) + k, first + k)
+        lower, upper = zip(*(self._bounds(kind, v) for v in values)) if len(ids) else ((), ())
+        self.h.addRows(len(ids), np.array(lower, dtype=float), np.array(upper, dtype=float), 0,
+                       np.zeros(len(ids) + 1, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0))
+        start = len(self._ids[kind])
+        self._ids[kind].extend(ids)
+        self._xy[kind] = np.vstack([self._xy[kind], xy])
+        self._active[kind] = np.append(self._active[kind], np.ones(len(ids), dtype=bool))
+        if not link:
+            return
+        new = np.arange(start, start + len(ids))
+        if kind == 'source':
+            self._sync_sources(new)
+        elif self.k_nearest is not None:
+            # neue Senken können in die k nächsten jeder Quelle rücken
+            self._sync_sources(np.flatnonzero(self._active['source']))
+        else:
+            # neue Senken nur mit aktiven Quellen verbinden
+            others = np.flatnonzero(self._active['source'])
+            a, b, cost = _arcs(self._xy['source'][others], self._xy['sink'][new], self.max_distance_m, None,
+                               self.road_graph)
+            self._add_arcs(others[a], new[b], cost)
+
+    def _sync_sources(self, sources):
+        # Arcs der Quellen = Arcs, die ein Kaltstart mit allen aktiven Senken bauen würde
+        sinks = np.flatnonzero(self._active['sink'])
+        a, b, cost = _arcs(self._xy['source'][sources], self._xy['sink'][sinks], self.max_distance_m,
+                           self.k_nearest, self.road_graph)
+        a, b = sources[a], sinks[b]
+        wanted = set(zip(a.tolist(), b.tolist()))
+        for col in np.flatnonzero(np.isin(self._arc_src, sources)).tolist():
+            keep = (int(self._arc_src[col]), int(self._arc_sink[col])) in wanted
+            if keep != self._enabled[col]:
+                self.h.changeColBounds(col, 0.0, highspy.kHighsInf if keep else 0.0)
+                self._enabled[col] = keep
+        new = np.array([pair not in self._cols for pair in zip(a.tolist(), b.tolist())], dtype=bool)
+        self._add_arcs(a[new], b[new], cost[new])
+
+    def _add_arcs(self, arc_src, arc_sink, cost):
+        n = len(cost)
+        first = self.h.getNumCol()
+        src_rows = np.array([self._rows['source'][self._ids['source'][i]][1] for i in arc_src.tolist()], dtype=np.int32)
+        sink_rows = np.array([self._rows['sink'][self._ids['sink'][j]][1] for j in arc_sink.tolist()], dtype=np.int32)
+        self.h.addCols(n, np.asarray(cost, dtype=float), np.zeros(n), np.full(n, highspy.kHighsInf), 2 * n,
+                       np.arange(0, 2 * n, 2, dtype=np.int32), np.column_stack([src_rows, sink_rows]).ravel(),
+                       np.ones(2 * n))
+        self._cols.update(zip(zip(arc_src.tolist(), arc_sink.tolist()), range(first, first + n)))
+        self._arc_src = np.concatenate([self._arc_src, arc_src])
+        self._arc_sink = np.concatenate([self._arc_sink, arc_sink])
+        self._enabled = np.concatenate([self._enabled, np.ones(n, dtype=bool)])
+
+    def _set(self, kind, ids, values):
+        for i, v in zip(ids, values):
+            self.h.changeRowBounds(self._rows[kind][i][1], *self._bounds(kind, float(v)))
+
+    def set_supply(self, source_ids, supply_mw):
+        self._set('source', np.atleast_1d(source_ids).tolist(), np.atleast_1d(supply_mw))
+
+    def set_demand(self, sink_ids, demand_mw):
+        self._set('sink', np.atleast_1d(sink_ids).tolist(), np.atleast_1d(demand_mw))
+
+    def set_cost(self, source_id, sink_id, cost_km):
+        pos = (self._rows['source'][source_id][0], self._rows['sink'][sink_id][0])
+        if pos not in self._cols:
+            raise ValueError(f"no arc between {source_id!r} and {sink_id!r}")
+        self.h.changeColCost(self._cols[pos], float(cost_km))
+
+    def add_sources(self, sources):
+        self._add('source', sources['id'].tolist(), sources['supply_mw'].to_numpy(dtype=float),
+                  shapely.get_coordinates(shapely.centroid(sources.geometry.values)))
+
+    def add_sinks(self, sinks):
+        self._add('sink', sinks['id'].tolist(), sinks['demand_mw'].to_numpy(dtype=float),
+                  shapely.get_coordinates(shapely.centroid(sinks.geometry.values)))
+
+    def _remove(self, kind, ids):
+        ids = np.atleast_1d(ids).tolist()
+        self._set(kind, ids, np.zeros(len(ids)))
+        self._active[kind][[self._rows[kind][i][0] for i in ids]] = False
+        if kind == 'sink' and self.k_nearest is not None:
+            # frei gewordene Plätze unter den k nächsten neu besetzen
+            self._sync_sources(np.flatnonzero(self._active['source']))
+
+    def remove_sources(self, source_ids):
+        self._remove('source', source_ids)
+
+    def remove_sinks(self, sink_ids):
+        self._remove('sink', sink_ids)
+
+    def solve(self):
+        # HiGHS startet nach Änderungen automatisch von der vorhandenen Basis
+        self.h.run()
+        if self.h.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+            raise ValueError(f"allocation LP not solved: {self.h.modelStatusToString(self.h.getModelStatus())}")
+        values = np.asarray(self.h.getSolution().col_value)
+        used = np.flatnonzero(values > 1e-9)
+        src_ids, sink_ids = self._ids['source'], self._ids['sink']
+        return [{'source': src_ids[self._arc_src[a]], 'sink': sink_ids[self._arc_sink[a]], 'flow_mw': values[a]}
+                for a in used]
+
+    @property
+    def objective(self):
+        return self.h.getInfo().objective_function_value
+
+# Beispiel: optimize_allocation(firms, demand_cells, max_distance_m=5000)
+#           optimize_allocation(firms, demand_cells, k_nearest=10, max_distance_m=10000, solver='highs')
+#           model = AllocationModel(firms, demand_cells, k_nearest=10); model.solve()
+#           model.set_supply('firm_17', 2.5); model.add_sinks(new_district); model.solve()
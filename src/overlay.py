@@ -1,5 +1,17 @@
-# Kombinationsregel (Beispiel)
-grid['combined_score'] = (grid['total_abwaerme_mw_GiZ'].fillna(0).clip(-3,3)/3)*0.6 + \
-                         (grid['total_waermebedarf_mw_GiZ'].fillna(0).clip(-3,3)/3)*0.4
+# src/overlay.py
+# Kombinationsregel: gewichtete Summe der auf [-1, 1] begrenzten Gi-z-Werte (|z| > 3 gekappt)
+def combine_scores(grid, w_heat=0.6, w_demand=0.4, heat_col='total_abwaerme_mw_GiZ',
+                   demand_col='total_waermebedarf_mw_GiZ', out_col='combined_score'):
+    grid[out_col] = (grid[heat_col].fillna(0).clip(-3,3)/3)*w_heat + \
+                    (grid[demand_col].fillna(0).clip(-3,3)/3)*w_demand
+    return grid
+
 # oder: binar (1 wenn beide signifikante Hotspots)
-grid['combined_bin'] = ((grid['total_abwaerme_mw_GiZ']>1.96) & (grid['total_waermebedarf_mw_GiZ']>1.96)).astype(int)
+def combine_binary(grid, z=1.96, heat_col='total_abwaerme_mw_GiZ', demand_col='total_waermebedarf_mw_GiZ',
+                   out_col='combined_bin'):
+    grid[out_col] = ((grid[heat_col]>z) & (grid[demand_col]>z)).astype(int)
+    return grid
+
+# Beispiel: grid = combine_scores(grid)                        # 0.6 Wärme / 0.4 Bedarf
+#           grid = combine_scores(grid, w_heat=0.5, w_demand=0.5)
+#           grid = combine_binary(grid)
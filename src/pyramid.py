@@ -0,0 +1,162 @@
+# src/pyramid.py
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from grid import _boundary_geometry, _clip_cells, flat_index, grid_spec
+
+# Aggregation einmal auf der feinsten Auflösung, gröbere Stufen per Blocksumme/-min/-max.
+# Nur summierbare Größen (Summen, Anzahlen, Min, Max) -> exakt auf jeder Stufe;
+# Mittelwerte als total_x / x_count ableiten, Quantile sind nicht ableitbar.
+REDUCERS = {'sum': np.add, 'min': np.fmin, 'max': np.fmax}
+
+def infer_reducer(col):
+    if col.startswith('total_') or col.endswith('_count'):
+        return 'sum'
+    if col.endswith('_min'):
+        return 'min'
+    if col.endswith('_max'):
+        return 'max'
+    return None
+
+def _block_reduce(arr, factor, reducer):
+    # (nx, ny) -> (nx/f, ny/f); Rand mit neutralem Element auffüllen
+    nx, ny = arr.shape
+    px, py = -nx % factor, -ny % factor
+    fill = 0 if reducer == 'sum' else (np.nan if arr.dtype.kind == 'f' else 0)
+    if px or py:
+        arr = np.pad(arr, ((0, px), (0, py)), constant_values=fill)
+    blocks = arr.reshape(arr.shape[0] // factor, factor, arr.shape[1] // factor, factor)
+    return REDUCERS[reducer].reduce(blocks, axis=(1, 3))
+
+class GridPyramid:
+
+    def __init__(self, grid_gdf, columns=None, reducers=None, boundary=None):
+        # grid_gdf: feinstes Grid aus create_grid mit aggregierten Spalten (z.B. aggregate_layers)
+        spec = grid_spec(grid_gdf)
+        if spec is None:
+            raise ValueError("pyramid needs a grid from create_grid (ix/iy columns)")
+        reducers = dict(reducers or {})
+        if columns is None:
+            columns = [c for c in grid_gdf.columns if c not in reducers and infer_reducer(c)]
+        for col in columns:
+            reducers.setdefault(col, infer_reducer(col))
+            if reducers[col] not in REDUCERS:
+                raise ValueError(f"column {col!r} is not sum/min/max reducible")
+        self.spec = spec
+        self.crs = grid_gdf.crs
+        self.reducers = {c: reducers[c] for c in columns}
+        self.boundary = None if boundary is None else _boundary_geometry(boundary)
+        ix = grid_gdf['ix'].values.astype(np.int64)
+        iy = grid_gdf['iy'].values.astype(np.int64)
+        present = np.zeros((spec['nx'], spec['ny']), dtype=bool)
+        present[ix, iy] = True
+        arrays = {}
+        for col, reducer in self.reducers.items():
+            values = grid_gdf[col].to_numpy(dtype=float)
+            arr = np.zeros(present.shape) if reducer == 'sum' else np.full(present.shape, np.nan)
+            arr[ix, iy] = values
+            arrays[col] = arr
+        self._levels = {1: (present, arrays)}
+        self._cells = {}
+
+    @property
+    def base_size(self):
+        return self.spec['cell_size']
+
+    def factor(self, cell_size):
+        factor = cell_size / self.base_size
+        if factor < 1 or abs(factor - round(factor)) > 1e-9:
+            raise ValueError(f"{cell_size} is not a multiple of the base cell size {self.base_size}")
+        return int(round(factor))
+
+    def arrays(self, cell_size):
+        # dichte (nx, ny)-Arrays einer Stufe; aus der gröbsten bereits berechneten Stufe, die f teilt
+        factor = self.factor(cell_size)
+        if factor not in self._levels:
+            src = max(f for f in self._levels if factor % f == 0)
+            step = factor // src
+            present, arrays = self._levels[src]
+            self._levels[factor] = (_block_reduce(present, step, 'max').astype(bool),
+                                    {c: _block_reduce(a, step, self.reducers[c]) for c, a in arrays.items()})
+        return self._levels[factor]
+
+    def _level_spec(self, cell_size):
+        present = self.arrays(cell_size)[0]
+        return dict(self.spec, cell_size=float(cell_size), nx=present.shape[0], ny=present.shape[1])
+
+    def cells(self, cell_size):
+        # Zellen einer Stufe wie create_grid(boundary, cell_size): ix, iy, Geometrie, clipped und
+        # der flache Index (x außen, y innen); cell_id = Position in dieser Reihenfolge
+        if cell_size not in self._cells:
+            present = self.arrays(cell_size)[0]
+            ix, iy = np.nonzero(present)
+            x0 = self.spec['x0'] + ix * cell_size
+            y0 = self.spec['y0'] + iy * cell_size
+            cells = shapely.box(x0, y0, x0 + cell_size, y0 + cell_size)
+            clipped = np.zeros(len(cells), dtype=bool)
+            if self.boundary is not None:
+                cells, keep, clipped = _clip_cells(cells, self.boundary)
+                ix, iy, cells, clipped = ix[keep], iy[keep], cells[keep], clipped[keep]
+            cells = gpd.GeoDataFrame({'ix': ix, 'iy': iy, 'clipped': clipped}, geometry=cells, crs=self.crs)
+            self._cells[cell_size] = (cells, flat_index(cells, self._level_spec(cell_size)))
+        return self._cells[cell_size]
+
+    def _cell_ids(self, cell_size, flat):
+        # flacher Index -> cell_id der Stufe, -1 = Zelle gibt es auf der Stufe nicht
+        _, level_flat = self.cells(cell_size)
+        flat = np.asarray(flat)
+        pos = np.searchsorted(level_flat, flat)
+        found = pos < len(level_flat)
+        found[found] = level_flat[pos[found]] == flat[found]
+        return np.where(found, pos, -1)
+
+    def parent_id(self, cell_size, ix, iy, parent_size):
+        # cell_id der übergeordneten Zelle (gleiche Nummerierung wie create_grid auf der Elternstufe)
+        if self.factor(parent_size) % self.factor(cell_size):
+            raise ValueError(f"{parent_size} is not a multiple of {cell_size}")
+        step = self.factor(parent_size) // self.factor(cell_size)
+        parent_ny = self._level_spec(parent_size)['ny']
+        return self._cell_ids(parent_size, (np.asarray(ix) // step) * parent_ny + np.asarray(iy) // step)
+
+    def children(self, cell_size, cell_id, child_size):
+        # cell_ids aller Kindzellen einer Zelle auf der Stufe child_size
+        step = self.factor(cell_size) // self.factor(child_size)
+        cells, _ = self.cells(cell_size)
+        ix, iy = int(cells['ix'].iloc[cell_id]), int(cells['iy'].iloc[cell_id])
+        child_ny = self._level_spec(child_size)['ny']
+        cx, cy = np.meshgrid(np.arange(ix * step, (ix + 1) * step), np.arange(iy * step, (iy + 1) * step), indexing='ij')
+        ids = self._cell_ids(child_size, cx.ravel() * child_ny + cy.ravel())
+        return np.sort(ids[ids >= 0])
+
+    def level(self, cell_size, parent_size=None):
+        # GeoDataFrame einer Stufe: cell_id, ix, iy, (parent_id), Werte, Zellgeometrie
+        _, arrays = self.arrays(cell_size)
+        cells, _ = self.cells(cell_size)
+        ix, iy = cells['ix'].values, cells['iy'].values
+        gdf = cells.copy()
+        gdf.insert(0, 'cell_id', np.arange(len(gdf)))
+        if parent_size is not None:
+            gdf['parent_id'] = self.parent_id(cell_size, ix, iy, parent_size)
+        for col, arr in arrays.items():
+            gdf[col] = arr[ix, iy]
+        gdf = gdf[['cell_id', 'ix', 'iy', 'clipped'] + [c for c in gdf.columns if c not in
+                                                       ('cell_id', 'ix', 'iy', 'clipped', 'geometry')] + ['geometry']]
+        gdf.attrs['grid'] = self._level_spec(cell_size)
+        return gdf
+
+    def levels(self, cell_sizes):
+        # alle Stufen, jede mit parent_id auf die nächstgröbere, in die sie exakt aufgeht
+        # (z.B. 100 -> 200 -> 1000, 500 -> 1000)
+        cell_sizes = sorted(cell_sizes)
+        out = {}
+        for i, size in enumerate(cell_sizes):
+            parent = next((p for p in cell_sizes[i + 1:] if self.factor(p) % self.factor(size) == 0), None)
+            out[size] = self.level(size, parent)
+        return out
+
+# Beispiel:
+# grid = aggregate_layers(create_grid(bremen, 100), {'firms': (firms, 'abwaerme_mw')},
+#                         stats=('sum', 'count', 'min', 'max'))
+# pyramid = GridPyramid(grid, boundary=bremen)
+# levels = pyramid.levels([100, 200, 500, 1000])
@@ -0,0 +1,142 @@
+# src/sweep.py
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from analysis import aggregate_demand_to_grid, aggregate_heat_to_grid, analyze_heat_demand_balance
+from clustering import cluster_hotspots
+from grid import create_grid
+from hotspot import getis_ord_batch
+from overlay import combine_scores
+
+# Parameter-Sweep über die Analysekette. Schritte und die Parameter, von denen sie abhängen:
+#   grid    - cell_size_m                      (create_grid + Wärme/Bedarf aggregieren)
+#   hotspot - cell_size_m, k                   (Gi für Wärme und Bedarf, analytisch)
+#   cluster - alle übrigen (Gewichte, threshold, eps, min_samples, method, ...)
+# grid/hotspot laufen je Parameterkombination nur einmal (im Hauptprozess) und landen als .npy im
+# work_dir; die Szenarien laufen im Prozess-Pool und lesen die Arrays per memory map.
+SWEEP_DIR = 'data/cache/sweep'
+DEFAULTS = {'cell_size_m': 200, 'k': 8, 'w_heat': 0.6, 'w_demand': 0.4, 'threshold': 0.2,
+            'method': 'dbscan', 'eps': 300, 'min_samples': 3, 'connectivity': 'queen', 'min_size': 1}
+GRID_ARRAYS = ('ix', 'iy', 'x', 'y', 'area', 'total_abwaerme_mw', 'total_waermebedarf_mw', 'net_heat_mw')
+HOTSPOT_COLS = ('total_abwaerme_mw', 'total_waermebedarf_mw')
+
+def expand_grid(param_grid):
+    # {'cell_size_m': [100, 200], 'k': [8]} -> Liste vollständiger Szenarien (mit DEFAULTS)
+    names = list(param_grid)
+    unknown = set(names) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown sweep parameters {sorted(unknown)}")
+    return [dict(DEFAULTS, **dict(zip(names, values))) for values in itertools.product(*param_grid.values())]
+
+def _inputs_key(boundary, firms, buildings):
+    # Eingabedaten-Fingerprint, damit der work_dir nur bei gleichen Eingaben wiederverwendet wird
+    h = hashlib.sha1()
+    for gdf in (boundary, firms, buildings):
+        h.update(str(gdf.crs).encode())
+        h.update(np.ascontiguousarray(gdf.geometry.bounds.to_numpy()).tobytes())
+        for col in ('abwaerme_mw', 'waermebedarf_mw'):
+            if col in gdf:
+                h.update(gdf[col].to_numpy(dtype=float).tobytes())
+    return h.hexdigest()[:16]
+
+def _save(path, arrays, meta=None):
+    tmp = path + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta or {}, f)
+    os.replace(tmp, path)
+
+def _grid_step(path, boundary, firms, buildings, cell_size_m):
+    grid = create_grid(boundary, cell_size_m)
+    grid = aggregate_heat_to_grid(grid, firms)
+    grid = analyze_heat_demand_balance(aggregate_demand_to_grid(grid, buildings))
+    centre = shapely.get_coordinates(shapely.centroid(grid.geometry.values))
+    arrays = {c: grid[c].to_numpy() for c in GRID_ARRAYS if c in grid}
+    arrays.update(x=centre[:, 0], y=centre[:, 1], area=shapely.area(grid.geometry.values))
+    _save(path, arrays, {'grid': grid.attrs['grid'], 'crs': str(grid.crs)})
+    return grid
+
+def _hotspot_step(path, grid, k):
+    grid = getis_ord_batch(grid, HOTSPOT_COLS, k=k)
+    _save(path, {f'{c}_GiZ': grid[f'{c}_GiZ'].to_numpy() for c in HOTSPOT_COLS})
+
+def _load(path):
+    arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r')
+              for name in os.listdir(path) if name.endswith('.npy')}
+    with open(os.path.join(path, 'meta.json')) as f:
+        return arrays, json.load(f)
+
+def _load_grid(grid_path, extra=None):
+    # leichtes Grid aus den gemappten Arrays: Zellmittelpunkte als Geometrie (reicht für KNN-Gewichte,
+    # DBSCAN und Raster)
+    cells, meta = _load(grid_path)
+    grid = gpd.GeoDataFrame({**cells, **(extra or {})}, geometry=gpd.points_from_xy(cells['x'], cells['y']),
+                            crs=meta['crs'])
+    grid.attrs['grid'] = meta['grid']
+    return grid
+
+def _run_scenario(task):
+    scenario_id, scenario, grid_path, hotspot_path, out_dir = task
+    z, _ = _load(hotspot_path)
+    grid = _load_grid(grid_path, z)
+    grid = combine_scores(grid, scenario['w_heat'], scenario['w_demand'])
+    clusters = cluster_hotspots(grid, eps=scenario['eps'], min_samples=scenario['min_samples'],
+                                threshold=scenario['threshold'], method=scenario['method'],
+                                connectivity=scenario['connectivity'], min_size=scenario['min_size'])
+    # tidy Tabelle je Szenario: eine Zeile je Cluster
+    members = clusters[clusters['cluster'] >= 0]
+    table = members.groupby('cluster').agg(
+        n_cells=('cluster', 'size'), area_m2=('area', 'sum'), total_abwaerme_mw=('total_abwaerme_mw', 'sum'),
+        total_waermebedarf_mw=('total_waermebedarf_mw', 'sum'), net_heat_mw=('net_heat_mw', 'sum'),
+        peak_combined_score=('combined_score', 'max')).reset_index()
+    table.insert(0, 'scenario_id', scenario_id)
+    table.to_csv(os.path.join(out_dir, f'{scenario_id}.csv'), index=False)
+    return {'scenario_id': scenario_id, **scenario, 'cells': len(grid), 'candidates': len(clusters),
+            'clusters': len(table), 'noise_cells': int((clusters['cluster'] < 0).sum()),
+            'cluster_area_m2': table['area_m2'].sum(), 'cluster_abwaerme_mw': table['total_abwaerme_mw'].sum(),
+            'cluster_waermebedarf_mw': table['total_waermebedarf_mw'].sum()}
+
+def run_sweep(boundary, firms, buildings, param_grid, out_dir='results/sweep', work_dir=SWEEP_DIR, n_jobs=-1):
+    # boundary/firms/buildings wie für create_grid / aggregate_*_to_grid (Arbeits-CRS);
+    # schreibt out_dir/<scenario_id>.csv je Szenario und out_dir/scenarios.csv (eine Zeile je Szenario)
+    scenarios = expand_grid(param_grid)
+    work_dir = os.path.join(work_dir, _inputs_key(boundary, firms, buildings))
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = []
+    grids = {}
+    for i, sc in enumerate(scenarios):
+        grid_path = os.path.join(work_dir, f"grid-{sc['cell_size_m']}")
+        hotspot_path = grid_path + f"-k{sc['k']}"
+        if not os.path.exists(hotspot_path):
+            if sc['cell_size_m'] not in grids:
+                # grid-Schritt aus einem früheren Lauf wiederverwenden, nur neues k rechnen
+                grids[sc['cell_size_m']] = _load_grid(grid_path) if os.path.exists(grid_path) else \
+                    _grid_step(grid_path, boundary, firms, buildings, sc['cell_size_m'])
+            _hotspot_step(hotspot_path, grids[sc['cell_size_m']], sc['k'])
+        tasks.append((f'scenario_{i:04d}', sc, grid_path, hotspot_path, out_dir))
+    grids.clear()
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs <= 1:
+        rows = [_run_scenario(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(n_jobs) as ex:
+            rows = list(ex.map(_run_scenario, tasks))
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(out_dir, 'scenarios.csv'), index=False)
+    return results
+
+# Beispiel:
+# results = run_sweep(bremen, firms, buildings, {'cell_size_m': [100, 200], 'k': [8, 16],
+#                                                'w_heat': [0.4, 0.6], 'threshold': [0.1, 0.2],
+#                                                'eps': [200, 300]})
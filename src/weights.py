@@ -0,0 +1,61 @@
+# src/weights.py
+import hashlib
+import os
+import time
+
+import numpy as np
+import shapely
+from scipy import sparse
+from scipy.spatial import cKDTree
+from libpysal.graph import Graph
+
+# KNN-Gewichte je Grid nur einmal bauen: Schlüssel = Fingerprint der Zellgeometrie + k + transform,
+# im Speicher und als CSR (.npz) auf der Platte; Wiederverwendung für alle Wertespalten/Szenarien
+WEIGHTS_DIR = 'data/cache/weights'
+_memory = {}
+
+def grid_fingerprint(grid_gdf):
+    h = hashlib.sha1()
+    h.update(str(grid_gdf.crs).encode())
+    h.update(np.ascontiguousarray(shapely.get_coordinates(shapely.centroid(grid_gdf.geometry.values))).tobytes())
+    return h.hexdigest()[:20]
+
+def _knn_matrix(coords, k, transform):
+    # wie libpysal.weights.KNN: k nächste Nachbarn ohne die Zelle selbst
+    n = len(coords)
+    _, idx = cKDTree(coords).query(coords, k=k + 1)
+    keep = idx != np.arange(n)[:, None]
+    # bei deckungsgleichen Punkten kann die Zelle selbst fehlen -> letzten Nachbarn verwerfen
+    keep[keep.all(axis=1), -1] = False
+    cols = idx[keep].reshape(n, k)
+    data = np.full(n * k, 1.0 / k if transform.lower() == 'r' else 1.0)
+    return sparse.csr_matrix((data, cols.ravel(), np.arange(0, n * k + 1, k)), shape=(n, n))
+
+def knn_weights(grid_gdf, k=8, transform='r', cache_dir=WEIGHTS_DIR, max_age_days=1):
+    # liefert libpysal Graph (von esda.G_Local direkt nutzbar); cache_dir=None nur Speicher-Cache
+    key = f'{grid_fingerprint(grid_gdf)}-k{k}-{transform.lower()}'
+    if key in _memory:
+        return _memory[key]
+    path = None if cache_dir is None else os.path.join(cache_dir, f'{key}.npz')
+    fresh = path is not None and os.path.exists(path) and \
+        (max_age_days is None or time.time() - os.path.getmtime(path) < max_age_days * 86400)
+    if fresh:
+        matrix = sparse.load_npz(path)
+    else:
+        coords = shapely.get_coordinates(shapely.centroid(grid_gdf.geometry.values))
+        matrix = _knn_matrix(coords, k, transform)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = path + '.tmp.npz'
+            sparse.save_npz(tmp, matrix)
+            os.replace(tmp, path)
+    w = Graph.from_sparse(matrix)
+    _memory[key] = w
+    return w
+
+def clear_weights(cache_dir=WEIGHTS_DIR):
+    _memory.clear()
+    if cache_dir is not None and os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(cache_dir, name))
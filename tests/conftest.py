@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+GEOFABRIK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'geofabrik bremen')
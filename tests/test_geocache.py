@@ -0,0 +1,11 @@
+# tests/test_geocache.py
+from geocache import GeocodeCache
+
+VARIANTS = ['Hauptstraße 1, 28195 Bremen', 'Hauptstr. 1, 28195 Bremen']
+
+def test_spelling_variants_share_one_entry(tmp_path):
+    with GeocodeCache(str(tmp_path / 'cache.sqlite')) as cache:
+        cache.put(VARIANTS[1], 53.08, 8.80)
+        assert cache.get_many(VARIANTS) == {a: (53.08, 8.80) for a in VARIANTS}
+        assert cache.pending(VARIANTS) == []
+        assert len(cache) == 1
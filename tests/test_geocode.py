@@ -0,0 +1,57 @@
+# tests/test_geocode.py
+import asyncio
+import time
+
+import pytest
+
+from benchmark import stub_geocoder
+from geocode import TokenBucket, geocode_addresses
+
+ADDRESSES = [f'Teststraße {i}, 28195 Bremen' for i in range(12)]
+
+def test_token_bucket_rate():
+    async def take(n):
+        bucket = TokenBucket(rate=50, burst=1)
+        for _ in range(n):
+            await bucket.acquire()
+    start = time.monotonic()
+    asyncio.run(take(11))
+    assert time.monotonic() - start >= 10 / 50 * 0.9
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retries_on_throttle_and_server_errors(status):
+    with stub_geocoder(latency=0.0, fail_every=3, fail_status=status) as url:
+        results = geocode_addresses(ADDRESSES, url=url, rate=1000, burst=10, concurrency=4, retries=4, backoff=0.01)
+    assert {r.status for r in results.values()} == {'ok'}
+    assert results[ADDRESSES[0]][:2] == (53.08, 8.80)
+
+def test_gives_up_after_retries():
+    with stub_geocoder(latency=0.0, fail_every=1, fail_status=503) as url:
+        results = geocode_addresses(ADDRESSES[:3], url=url, rate=1000, burst=10, retries=2, backoff=0.01)
+    assert {r.status for r in results.values()} == {'error'}
+
+def test_client_error_is_not_retried():
+    with stub_geocoder(latency=0.0, fail_every=1, fail_status=404) as url:
+        start = time.monotonic()
+        results = geocode_addresses(ADDRESSES[:3], url=url, rate=1000, burst=10, retries=4, backoff=1.0)
+    assert {r.status for r in results.values()} == {'error'}
+    assert time.monotonic() - start < 1.0
+
+def test_rate_limit_against_stub():
+    start = time.monotonic()
+    with stub_geocoder(latency=0.0, fail_every=0) as url:
+        results = geocode_addresses(ADDRESSES, url=url, rate=40, burst=1, concurrency=8)
+    assert len(results) == len(ADDRESSES)
+    assert time.monotonic() - start >= (len(ADDRESSES) - 1) / 40 * 0.9
+
+def test_concurrency_speedup_against_stub():
+    # feste Server-Latenz: 8 Anfragen gleichzeitig müssen deutlich schneller sein als seriell
+    timings = {}
+    with stub_geocoder(latency=0.05, fail_every=0) as url:
+        for concurrency in (1, 8):
+            start = time.monotonic()
+            results = geocode_addresses(ADDRESSES, url=url, rate=1000, burst=16, concurrency=concurrency)
+            timings[concurrency] = time.monotonic() - start
+            assert {r.status for r in results.values()} == {'ok'}
+    assert timings[1] >= len(ADDRESSES) * 0.05
+    assert timings[8] < timings[1] / 3
@@ -0,0 +1,11 @@
+# tests/test_hotspot.py
+import numpy as np
+
+from benchmark import synthetic_grid
+from hotspot import compute_getis_ord
+
+def test_permutation_seed_is_reproducible():
+    grid = synthetic_grid(400)
+    a = compute_getis_ord(grid.copy(), inference='permutation', permutations=99, n_jobs=1, seed=7, weights_dir=None)
+    b = compute_getis_ord(grid.copy(), inference='permutation', permutations=99, n_jobs=1, seed=7, weights_dir=None)
+    np.testing.assert_array_equal(a['total_abwaerme_mw_GIp'], b['total_abwaerme_mw_GIp'])
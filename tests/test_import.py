@@ -0,0 +1,23 @@
+# tests/test_import.py
+import importlib
+import os
+
+import pytest
+import shapely
+from shapely.geometry import box
+
+from conftest import GEOFABRIK
+
+ingest = importlib.import_module('import')
+PLACES = os.path.join(GEOFABRIK, 'gis_osm_places_free_1.shp')
+
+@pytest.mark.skipif(not os.path.exists(PLACES), reason='geofabrik extract missing')
+def test_bbox_and_mask_together():
+    places = ingest.load_osm_buildings(PLACES, cache_dir=None)
+    centre = places[places['name'] == 'Bremen'].geometry.iloc[0]
+    mask = shapely.buffer(centre, 8000)
+    bbox = (centre.x - 10000, centre.y - 10000, centre.x + 2000, centre.y + 10000)
+    got = ingest.load_osm_buildings(PLACES, bbox=bbox, mask=mask, cache_dir=None)
+    expected = places[places.intersects(box(*bbox)) & places.intersects(mask)]
+    assert 0 < len(got) < len(places)
+    assert sorted(got['osm_id']) == sorted(expected['osm_id'])
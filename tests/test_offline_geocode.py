@@ -0,0 +1,32 @@
+# tests/test_offline_geocode.py
+import pandas as pd
+
+import pytest
+
+from offline_geocode import OfflineGeocoder, normalize_street
+
+@pytest.mark.parametrize('street, expected', [('Am Wall 12-14a', 'am wall'), ('Hauptstr. 5/7', 'hauptstr'),
+                                              ('Hafenstraße 3', 'hafenstr'), ('Str. des 17. Juni 4', 'str des 17 juni')])
+def test_normalize_street_strips_house_number_ranges(street, expected):
+    assert normalize_street(street) == expected
+
+def test_match_levels():
+    localities = pd.DataFrame({'lat': [53.08, 53.17], 'lon': [8.80, 8.62]}, index=pd.Index(['bremen', 'vegesack'], name='key'))
+    streets = pd.DataFrame({'locality': ['bremen', 'bremen'], 'key': ['hafenstr', 'am wall'],
+                            'lat': [53.095, 53.077], 'lon': [8.76, 8.81]})
+    landmarks = pd.DataFrame({'locality': ['bremen'], 'key': ['überseestadt'], 'lat': [53.098], 'lon': [8.774]})
+    postcodes = pd.DataFrame({'plz': ['99999'], 'lat': [50.0], 'lon': [9.0]})
+    geocoder = OfflineGeocoder(localities, streets, landmarks, postcodes)
+    df = pd.DataFrame({'street': ['Hafenstraße 12', 'Am Wal 1', 'Überseestadt 1', 'Bar 1', 'Nowhere 1', 'x 1',
+                                  'Am Wall 12-14a', 'Hafenstr. 5/7'],
+                       'plz': ['28217', 28195, '28217', '99999', '28755', '11111', '28195', '28217'],
+                       'ort': ['Bremen', 'Bremen', 'Bremen', 'Xyz', 'Bremen-Vegesack', 'Nirgendwo', 'Bremen', 'Bremen']},
+                      index=list('abcdefgh'))
+    out = geocoder.geocode(df['street'], df['plz'], df['ort'])
+    assert list(out.index) == list('abcdefgh')
+    assert out['match_level'].tolist() == ['street', 'street', 'landmark', 'postcode', 'locality', 'none',
+                                           'street', 'street']
+    assert out.loc[['g', 'h'], 'match_score'].tolist() == [1.0, 1.0]
+    assert out['matched_name'].tolist()[:2] == ['hafenstr', 'am wall']
+    assert 0.85 <= out.loc['b', 'match_score'] < 1.0
+    assert out.loc['f', ['Latitude', 'Longitude']].isna().all()
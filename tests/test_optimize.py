@@ -0,0 +1,54 @@
+# tests/test_optimize.py
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from benchmark import synthetic_allocation
+from optimize import SOLVERS, AllocationModel, optimize_allocation
+
+def _points(rng, n, col, lo, hi, prefix):
+    xy = rng.uniform(0, 20000, (n, 2))
+    return gpd.GeoDataFrame({'id': [f'{prefix}{i}' for i in range(n)], col: rng.uniform(lo, hi, n)},
+                            geometry=gpd.points_from_xy(*xy.T), crs='EPSG:25832')
+
+@pytest.mark.parametrize('solver', SOLVERS)
+def test_infeasible_pruning_raises(solver):
+    sources, sinks = synthetic_allocation(400)
+    with pytest.raises(ValueError, match='not solved'):
+        optimize_allocation(sources, sinks, max_distance_m=2500, solver=solver)
+    with pytest.raises(ValueError, match='no feasible arcs'):
+        optimize_allocation(sources, sinks, max_distance_m=1, solver=solver)
+
+@pytest.mark.parametrize('seed', [1, 3, 4, 5])
+def test_incremental_matches_cold_solve(seed):
+    # knappes Angebot, kleines k: neue Senken verdrängen Arcs aus den k nächsten der Quellen
+    rng = np.random.default_rng(seed)
+    sources = _points(rng, 40, 'supply_mw', 0.5, 1.5, 's')
+    sinks = _points(rng, 30, 'demand_mw', 0.3, 1.0, 't')
+    model = AllocationModel(sources, sinks.iloc[:15], k_nearest=4)
+    model.solve()
+    model.add_sinks(sinks.iloc[15:])
+    model.solve()
+    cold = AllocationModel(sources, sinks, k_nearest=4)
+    cold.solve()
+    assert model.objective == pytest.approx(cold.objective)
+    model.remove_sinks(['t3', 't20'])
+    model.solve()
+    cold = AllocationModel(sources, sinks.drop(index=[3, 20]), k_nearest=4)
+    cold.solve()
+    assert model.objective == pytest.approx(cold.objective)
+
+def test_rejected_add_leaves_model_unchanged():
+    rng = np.random.default_rng(0)
+    sources = _points(rng, 10, 'supply_mw', 1, 3, 's')
+    sinks = _points(rng, 5, 'demand_mw', 0.1, 0.5, 't')
+    model = AllocationModel(sources, sinks)
+    before = model.solve()
+    more = _points(np.random.default_rng(1), 3, 'supply_mw', 1, 3, 'n')
+    for bad in (more.assign(id=['n0', 'n1', 'n0']), more.assign(id=['n0', 's3', 'n2'])):
+        with pytest.raises(ValueError):
+            model.add_sources(bad)
+        assert 'n0' not in model._rows['source']
+    assert model.solve() == before
+    model.add_sources(more)
+    model.solve()
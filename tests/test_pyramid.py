@@ -0,0 +1,18 @@
+# tests/test_pyramid.py
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from grid import create_grid
+from pyramid import GridPyramid
+
+def test_level_ids_match_create_grid():
+    boundary = gpd.GeoDataFrame(geometry=[shapely.Point(1000, 1000).buffer(2370)], crs='EPSG:25832')
+    grid = create_grid(boundary, 100)
+    grid['total_x'] = np.random.default_rng(0).random(len(grid))
+    levels = GridPyramid(grid, boundary=boundary).levels([100, 200, 500, 1000])
+    for size, level in levels.items():
+        ref = create_grid(boundary, size)
+        np.testing.assert_array_equal(level[['cell_id', 'ix', 'iy']].values, ref[['cell_id', 'ix', 'iy']].values)
+    fine = levels[100].groupby('parent_id')['total_x'].sum()
+    np.testing.assert_allclose(fine.values, levels[200]['total_x'].values[fine.index])
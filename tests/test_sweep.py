@@ -0,0 +1,41 @@
+# tests/test_sweep.py
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+import sweep
+from clustering import cluster_hotspots
+
+def _inputs(seed=0):
+    rng = np.random.default_rng(seed)
+    boundary = gpd.GeoDataFrame(geometry=[box(0, 0, 5000, 5000)], crs='EPSG:25832')
+    firms = gpd.GeoDataFrame({'abwaerme_mw': rng.gamma(0.5, 2.0, 200)},
+                             geometry=gpd.points_from_xy(*rng.uniform(0, 5000, (2, 200))), crs='EPSG:25832')
+    buildings = gpd.GeoDataFrame({'waermebedarf_mw': rng.gamma(0.5, 1.0, 400)},
+                                 geometry=gpd.points_from_xy(*rng.uniform(0, 5000, (2, 400))), crs='EPSG:25832')
+    return boundary, firms, buildings
+
+def test_cluster_hotspots_without_candidates():
+    grid = gpd.GeoDataFrame({'combined_score': [0.1, 0.0]}, geometry=gpd.points_from_xy([0, 1], [0, 0]))
+    out = cluster_hotspots(grid, threshold=5.0)
+    assert len(out) == 0 and 'cluster' in out
+
+def test_sweep_threshold_without_clusters(tmp_path):
+    results = sweep.run_sweep(*_inputs(), {'cell_size_m': [500], 'threshold': [0.2, 5.0]},
+                              out_dir=str(tmp_path / 'out'), work_dir=str(tmp_path / 'work'), n_jobs=1)
+    assert results.loc[results['threshold'] == 5.0, 'clusters'].tolist() == [0]
+    assert results.loc[results['threshold'] == 0.2, 'candidates'].iloc[0] > 0
+
+def test_new_k_reuses_saved_grid(tmp_path, monkeypatch):
+    inputs = _inputs()
+    fresh = sweep.run_sweep(*inputs, {'cell_size_m': [500], 'k': [4]}, out_dir=str(tmp_path / 'a'),
+                            work_dir=str(tmp_path / 'fresh'), n_jobs=1)
+    work = str(tmp_path / 'work')
+    sweep.run_sweep(*inputs, {'cell_size_m': [500], 'k': [8]}, out_dir=str(tmp_path / 'b'), work_dir=work, n_jobs=1)
+    def no_grid(*args, **kwargs):
+        raise AssertionError('grid step recomputed')
+    monkeypatch.setattr(sweep, 'create_grid', no_grid)
+    reused = sweep.run_sweep(*inputs, {'cell_size_m': [500], 'k': [4]}, out_dir=str(tmp_path / 'c'), work_dir=work,
+                             n_jobs=1)
+    pd.testing.assert_frame_equal(fresh, reused)